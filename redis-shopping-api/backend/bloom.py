@@ -0,0 +1,114 @@
+"""
+Bloom filter of valid product IDs, stored as a plain Redis bitmap (no
+RedisBloom module needed).
+
+Redis holds the shared filter; each worker keeps a local copy of the bitmap
+refreshed every BLOOM_REFRESH_SECONDS, so checking an ID costs no round trip
+and scanners probing random IDs never reach the cache or the repository.
+
+Bit 0 is a sentinel that is always set: a missing key (never built, or evicted
+under allkeys-lru) reads as "unknown" rather than "every ID is invalid".
+New filters are built under a temporary key and RENAMEd into place, so
+readers never see a half-built filter.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import uuid
+
+import redis
+
+BLOOM_CAPACITY = int(os.getenv("BLOOM_CAPACITY", "100000"))
+BLOOM_ERROR_RATE = float(os.getenv("BLOOM_ERROR_RATE", "0.01"))
+BLOOM_REFRESH_SECONDS = float(os.getenv("BLOOM_REFRESH_SECONDS", "5"))
+
+BLOOM_KEY = "bloom:products:{catalog}"
+
+
+class ProductBloom:
+    def __init__(self, client, load_ids, capacity: int = BLOOM_CAPACITY,
+                 error_rate: float = BLOOM_ERROR_RATE, key: str = BLOOM_KEY):
+        self.client = client
+        self.load_ids = load_ids
+        self.key = key
+        self.bits = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.bits / capacity * math.log(2))), 1)
+        self._local = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def offsets(self, item) -> list:
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [1 + (h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def might_contain(self, item):
+        # True/False from the local copy, None while no filter is available
+        data = self._local
+        if not data or not data[0] & 0x80:
+            return None
+        for offset in self.offsets(item):
+            byte = offset >> 3
+            if byte >= len(data) or not (data[byte] >> (7 - (offset & 7))) & 1:
+                return False
+        return True
+
+    def build(self, batch: int = 10000):
+        temp = f"{self.key}:build:{uuid.uuid4().hex}"
+        pipe = self.client.pipeline(temp, transaction=False)
+        pipe.setbit(temp, 0, 1)
+        for item in self.load_ids():
+            for offset in self.offsets(item):
+                pipe.setbit(temp, offset, 1)
+            if len(pipe) >= batch:
+                pipe.execute()
+        pipe.expire(temp, 600)
+        pipe.rename(temp, self.key)
+        pipe.persist(self.key)
+        pipe.execute()
+        self._local = self.client.get_bytes(self.key)
+
+    def add(self, item):
+        offsets = self.offsets(item)
+        pipe = self.client.pipeline(self.key, transaction=False)
+        for offset in offsets:
+            pipe.setbit(self.key, offset, 1)
+        pipe.execute()
+        # Make the new ID visible to this worker right away
+        if self._local:
+            data = bytearray(self._local)
+            for offset in offsets:
+                if offset >> 3 >= len(data):
+                    data.extend(b"\0" * ((offset >> 3) + 1 - len(data)))
+                data[offset >> 3] |= 0x80 >> (offset & 7)
+            self._local = bytes(data)
+
+    def refresh(self):
+        data = self.client.get_bytes(self.key)
+        if data is None:
+            # Evicted or never built: rebuild from the repository
+            self.build()
+            return
+        self._local = data
+
+    def _run(self):
+        while not self._stop.wait(BLOOM_REFRESH_SECONDS):
+            try:
+                self.refresh()
+            except redis.RedisError:
+                pass
+
+    def start(self):
+        try:
+            self.refresh()
+        except redis.RedisError:
+            pass
+        self._thread = threading.Thread(target=self._run, name="bloom-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
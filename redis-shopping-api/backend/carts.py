@@ -0,0 +1,106 @@
+"""
+Guest carts and the merge into a user's cart on login.
+
+Anonymous visitors get a random cart ID in a cookie. Their cart lives in
+cart_db under cart:{guest:<id>}, in the same format as cart:{user_id}. On
+login, merge() folds the guest cart into the user's cart on the server: lines
+for the same product are summed, the result is written with a fresh TTL and
+the guest cart is deleted. The frontend does not replay its adds.
+
+Standalone Redis does the whole merge in one script. Under cluster or
+client-side sharding the two carts hash to different slots. There, GETDEL
+claims the guest cart first, so two concurrent logins cannot both merge it,
+and one script then merges it into the user's cart. If that script fails,
+the guest cart is put back.
+"""
+
+import secrets
+
+import redis
+
+from keys import cart_key
+from redis_clients import REDIS_MODE
+
+GUEST_COOKIE = "guest_cart"
+
+_LUA_MERGE = """
+local function merge(user_key, guest, ttl)
+  local current = redis.call('GET', user_key)
+  local lines, index = {}, {}
+  for _, source in ipairs({current or '[]', guest}) do
+    for _, item in ipairs(cjson.decode(source)) do
+      local pid = tostring(item.pid)
+      local line = index[pid]
+      if line then
+        line.qty = line.qty + (tonumber(item.qty) or 0)
+      else
+        line = {pid = item.pid, qty = tonumber(item.qty) or 0}
+        index[pid] = line
+        lines[#lines + 1] = line
+      end
+    end
+  end
+  if #lines == 0 then
+    return current
+  end
+  local merged = cjson.encode(lines)
+  redis.call('SET', user_key, merged, 'EX', ttl)
+  return merged
+end
+"""
+
+# KEYS: guest cart, user cart. ARGV: ttl
+MERGE_SCRIPT = _LUA_MERGE + """
+local guest = redis.call('GET', KEYS[1])
+if not guest then
+  return false
+end
+redis.call('DEL', KEYS[1])
+return merge(KEYS[2], guest, ARGV[1])
+"""
+
+# KEYS: user cart. ARGV: guest cart JSON, ttl
+MERGE_INTO_SCRIPT = _LUA_MERGE + """
+return merge(KEYS[1], ARGV[1], ARGV[2])
+"""
+
+
+def new_guest_id() -> str:
+    return secrets.token_hex(16)
+
+
+def valid_guest_id(value) -> bool:
+    # Only IDs we could have issued, so a cookie cannot name another key
+    return isinstance(value, str) and len(value) == 32 and all(c in "0123456789abcdef" for c in value)
+
+
+def guest_owner(guest_id: str) -> str:
+    """Cart owner for a guest; cart_key(guest_owner(id)) is cart:{guest:<id>}."""
+    return f"guest:{guest_id}"
+
+
+class GuestCarts:
+    def __init__(self, client, single_script: bool = REDIS_MODE == "standalone"):
+        self.client = client
+        self.single_script = single_script
+        self._merge = client.register_script(MERGE_SCRIPT)
+        self._merge_into = client.register_script(MERGE_INTO_SCRIPT)
+
+    def merge(self, guest_id: str, user_id, ttl: int):
+        """Fold the guest cart into the user's; the merged cart JSON, or None if there was no guest cart."""
+        guest_key = cart_key(guest_owner(guest_id))
+        user_key = cart_key(user_id)
+        if self.single_script:
+            return self._merge(keys=[guest_key, user_key], args=[ttl])
+
+        guest = self.client.getdel(guest_key)
+        if guest is None:
+            return None
+        try:
+            return self._merge_into(keys=[user_key], args=[guest, ttl])
+        except redis.RedisError:
+            try:
+                self.client.set(guest_key, guest, ex=ttl, nx=True)
+            except redis.RedisError:
+                pass
+            raise
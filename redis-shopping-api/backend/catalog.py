@@ -0,0 +1,172 @@
+"""
+Sorted-set indexes over the product catalog for /products listings.
+
+One ZSET per sort order, all tagged {catalog} so the page script touches a
+single slot:
+
+- products:by_price:{catalog}       score = price, member = pid
+- products:by_popularity:{catalog}  score = popularity, member = pid
+- products:by_name:{catalog}        score = 0, member = "<name>\\0<pid>" (lex order)
+
+plus products:summary:{catalog}, a hash of pid -> product JSON, so a page is
+one script call: find the cursor's rank (O(log N)), ZRANGE the page, HMGET the
+summaries. Indexes are built once from the repository and then kept up to
+date by upsert()/remove() on product writes.
+
+Cursors are opaque (score, member) pairs. If the cursor's product moved or
+was deleted since the previous page, the page resumes after the cursor's old
+score (or name) instead of failing.
+"""
+
+import base64
+import binascii
+import json
+import math
+
+PRICE_INDEX = "products:by_price:{catalog}"
+NAME_INDEX = "products:by_name:{catalog}"
+POPULARITY_INDEX = "products:by_popularity:{catalog}"
+SUMMARY_KEY = "products:summary:{catalog}"
+
+# sort name -> (index key, ordering)
+SORTS = {
+    "price": (PRICE_INDEX, "score"),
+    "name": (NAME_INDEX, "lex"),
+    "popularity": (POPULARITY_INDEX, "score"),
+}
+
+# KEYS: index, summaries. ARGV: ordering, reverse, limit, cursor score, cursor member
+PAGE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1], KEYS[2]) < 2 then
+  return false
+end
+local lex = ARGV[1] == 'lex'
+local rev = ARGV[2] == '1'
+local limit = tonumber(ARGV[3])
+local member = ARGV[5]
+local start = 0
+if member ~= '' then
+  local score = redis.call('ZSCORE', KEYS[1], member)
+  if score and (lex or tonumber(score) == tonumber(ARGV[4])) then
+    if rev then
+      start = redis.call('ZREVRANK', KEYS[1], member) + 1
+    else
+      start = redis.call('ZRANK', KEYS[1], member) + 1
+    end
+  elseif lex then
+    if rev then
+      start = redis.call('ZLEXCOUNT', KEYS[1], '[' .. member, '+')
+    else
+      start = redis.call('ZLEXCOUNT', KEYS[1], '-', '[' .. member)
+    end
+  else
+    if rev then
+      start = redis.call('ZCOUNT', KEYS[1], ARGV[4], '+inf')
+    else
+      start = redis.call('ZCOUNT', KEYS[1], '-inf', ARGV[4])
+    end
+  end
+end
+local entries
+if rev then
+  entries = redis.call('ZREVRANGE', KEYS[1], start, start + limit - 1, 'WITHSCORES')
+else
+  entries = redis.call('ZRANGE', KEYS[1], start, start + limit - 1, 'WITHSCORES')
+end
+local result = {}
+for i = 1, #entries, 2 do
+  local m = entries[i]
+  local pid = m
+  if lex then
+    pid = string.sub(m, string.find(m, '\\0', 1, true) + 1)
+  end
+  result[#result + 1] = {m, entries[i + 1], redis.call('HGET', KEYS[2], pid)}
+end
+return result
+"""
+
+
+def name_member(product: dict) -> str:
+    return f"{product['name'].casefold()}\0{product['id']}"
+
+
+def encode_cursor(score: str, member: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([score, member]).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        score, member = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not math.isfinite(float(score)):
+            raise ValueError("Invalid cursor")
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    return str(score), str(member)
+
+
+class CatalogIndex:
+    def __init__(self, client, load_products):
+        self.client = client
+        self.load_products = load_products
+        self._page = client.register_script(PAGE_SCRIPT)
+
+    def _index(self, pipe, product: dict, previous: dict = None):
+        pid = product["id"]
+        if previous is not None and previous["name"] != product["name"]:
+            pipe.zrem(NAME_INDEX, name_member(previous))
+        pipe.zadd(PRICE_INDEX, {pid: product["price"]})
+        pipe.zadd(NAME_INDEX, {name_member(product): 0})
+        # Popularity is accumulated separately; only make sure the pid is listed
+        pipe.zadd(POPULARITY_INDEX, {pid: 0}, nx=True)
+        pipe.hset(SUMMARY_KEY, pid, json.dumps(product))
+
+    def build(self, batch: int = 10000):
+        pipe = self.client.pipeline(PRICE_INDEX, transaction=False)
+        for product in self.load_products():
+            self._index(pipe, product)
+            if len(pipe) >= batch:
+                pipe.execute()
+        pipe.execute()
+
+    def ensure(self):
+        # Indexes are shared by all workers; build only if missing (or evicted)
+        if self.client.exists(PRICE_INDEX, SUMMARY_KEY) < 2:
+            self.build()
+
+    def upsert(self, product: dict, previous: dict = None):
+        pipe = self.client.pipeline(PRICE_INDEX)
+        self._index(pipe, product, previous)
+        pipe.execute()
+
+    def remove(self, product: dict):
+        pid = product["id"]
+        pipe = self.client.pipeline(PRICE_INDEX)
+        pipe.zrem(PRICE_INDEX, pid)
+        pipe.zrem(NAME_INDEX, name_member(product))
+        pipe.zrem(POPULARITY_INDEX, pid)
+        pipe.hdel(SUMMARY_KEY, pid)
+        pipe.execute()
+
+    def summaries(self, pids) -> list:
+        """Product JSON for pids in one HMGET, skipping unknown IDs."""
+        if not pids:
+            return []
+        return [json.loads(value) for value in self.client.hmget(SUMMARY_KEY, pids) if value]
+
+    def page(self, sort: str, reverse: bool = False, limit: int = 20, cursor: str = None):
+        """Return (products, next_cursor); next_cursor is None on the last page."""
+        key, ordering = SORTS[sort]
+        score, member = decode_cursor(cursor) if cursor else ("0", "")
+        args = (ordering, "1" if reverse else "0", limit, score, member)
+        entries = self._page(keys=[key, SUMMARY_KEY], args=args)
+        if entries is None:
+            # Never built, or the index or summaries evicted under allkeys-lru
+            self.build()
+            entries = self._page(keys=[key, SUMMARY_KEY], args=args) or []
+
+        products = [json.loads(summary) for _, _, summary in entries if summary]
+        next_cursor = None
+        if len(entries) == limit:
+            last_member, last_score, _ = entries[-1]
+            next_cursor = encode_cursor(str(last_score), last_member)
+        return products, next_cursor
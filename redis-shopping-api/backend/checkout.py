@@ -0,0 +1,267 @@
+"""
+Checkout: turn cart:{user_id} into an order.
+
+Inventory lives in cart_db next to the carts: stock:{catalog} (pid -> units)
+and prices:{catalog} (pid -> price). Placing an order means: check every
+cart line against stock, decrement stock, write order:{user_id}:<id>, push it
+onto orders:{user_id}, clear the cart and store the response under the
+Idempotency-Key.
+
+Standalone Redis does all of that in one script, so it is atomic. Under
+cluster or client-side sharding the stock keys ({catalog}) and the user's
+keys ({user_id}) live in different slots, so checkout becomes two
+single-slot scripts. RESERVE decrements stock. PLACE writes the order, but
+only if the cart is unchanged. If PLACE does not succeed, the reservation is
+rolled back with RESTOCK. An idempotency lock (SET NX) keeps retries from
+running the two steps twice. The lock names the order ID, and PLACE replaces
+it with the order. If PLACE's reply is lost (timeout, dropped connection),
+nothing is rolled back, because the order may already exist. The lock stays
+until it expires, and a retry looks up that order ID. If the order was never
+written, its reservation stays out of stock (an undersell, never an
+oversell).
+
+A retried request with the same Idempotency-Key gets the stored response
+back without touching stock again.
+
+stock:{catalog} is the only live inventory. Product reads on a cache miss
+take their stock from it, and after an order the caller rewrites the cached
+product, the catalog summary and the in_stock facet bit for the products
+sold (those live in cache_db, which a cart_db script cannot reach).
+"""
+
+import json
+import os
+import time
+import uuid
+
+import redis
+
+from keys import PRICE_KEY, STOCK_KEY, cart_key, idempotency_key, order_key, orders_key
+from redis_clients import REDIS_MODE
+from resilience import BreakerOpen
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# How long an in-flight checkout holds its Idempotency-Key (two-step mode)
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "30"))
+PENDING = "__pending__:"
+
+# Shared Lua: fold cart lines into units per product, reserve stock, place order
+_LUA_HELPERS = """
+local function aggregate(items)
+  local need, pids = {}, {}
+  for _, item in ipairs(items) do
+    local pid, qty = tostring(item.pid), tonumber(item.qty)
+    if not qty or qty <= 0 or qty ~= math.floor(qty) then
+      return nil, {'invalid', pid}
+    end
+    if not need[pid] then
+      need[pid] = 0
+      pids[#pids + 1] = pid
+    end
+    need[pid] = need[pid] + qty
+  end
+  return need, pids
+end
+
+local function reserve(stock_key, price_key, items)
+  local need, pids = aggregate(items)
+  if not need then
+    return nil, pids
+  end
+  if #pids == 0 then
+    return nil, {'empty'}
+  end
+  local total = 0
+  for _, pid in ipairs(pids) do
+    local have = tonumber(redis.call('HGET', stock_key, pid))
+    if not have then
+      return nil, {'unknown', pid}
+    end
+    if have < need[pid] then
+      return nil, {'stock', pid, have}
+    end
+    total = total + need[pid] * tonumber(redis.call('HGET', price_key, pid) or '0')
+  end
+  for _, pid in ipairs(pids) do
+    redis.call('HINCRBY', stock_key, pid, -need[pid])
+  end
+  return total
+end
+
+local function place(cart_key, order_key, orders_key, idem_key, order_id, items, total, created, ttl)
+  local order = cjson.encode({id = order_id, items = items, total = total, created = tonumber(created)})
+  redis.call('SET', order_key, order)
+  redis.call('LPUSH', orders_key, order_id)
+  redis.call('DEL', cart_key)
+  redis.call('SET', idem_key, order, 'EX', ttl)
+  return order
+end
+"""
+
+# KEYS: stock, prices, cart, order, orders, idempotency
+# ARGV: order id, created, idempotency ttl
+CHECKOUT_SCRIPT = _LUA_HELPERS + """
+local replay = redis.call('GET', KEYS[6])
+if replay then
+  return {'replay', replay}
+end
+local cart = redis.call('GET', KEYS[3])
+if not cart then
+  return {'empty'}
+end
+local items = cjson.decode(cart)
+local total, err = reserve(KEYS[1], KEYS[2], items)
+if not total then
+  return err
+end
+return {'ok', place(KEYS[3], KEYS[4], KEYS[5], KEYS[6], ARGV[1], items, total, ARGV[2], ARGV[3])}
+"""
+
+# KEYS: stock, prices. ARGV: cart JSON
+RESERVE_SCRIPT = _LUA_HELPERS + """
+local total, err = reserve(KEYS[1], KEYS[2], cjson.decode(ARGV[1]))
+if not total then
+  return err
+end
+return {'ok', total}
+"""
+
+# KEYS: cart, order, orders, idempotency. ARGV: expected cart, order id, total, created, ttl
+PLACE_SCRIPT = _LUA_HELPERS + """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+  return {'changed'}
+end
+local items = cjson.decode(ARGV[1])
+return {'ok', place(KEYS[1], KEYS[2], KEYS[3], KEYS[4], ARGV[2], items, tonumber(ARGV[3]), ARGV[4], ARGV[5])}
+"""
+
+# KEYS: stock. ARGV: cart JSON
+RESTOCK_SCRIPT = _LUA_HELPERS + """
+local need, pids = aggregate(cjson.decode(ARGV[1]))
+for _, pid in ipairs(pids) do
+  redis.call('HINCRBY', KEYS[1], pid, need[pid])
+end
+return #pids
+"""
+
+
+class CheckoutError(Exception):
+    """Checkout refused; status and detail map straight onto an HTTP error."""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+class EmptyCart(CheckoutError):
+    """No cart in Redis; the caller may know where to reload it from."""
+
+    def __init__(self):
+        super().__init__(400, "Cart is empty")
+
+
+class Checkout:
+    def __init__(self, client, load_products, single_script: bool = REDIS_MODE == "standalone"):
+        self.client = client
+        self.load_products = load_products
+        self.single_script = single_script
+        self._checkout = client.register_script(CHECKOUT_SCRIPT)
+        self._reserve = client.register_script(RESERVE_SCRIPT)
+        self._place = client.register_script(PLACE_SCRIPT)
+        self._restock = client.register_script(RESTOCK_SCRIPT)
+
+    def ensure(self):
+        # Seed inventory from the repository without resetting live stock
+        pipe = self.client.pipeline(STOCK_KEY, transaction=False)
+        for product in self.load_products():
+            pipe.hsetnx(STOCK_KEY, product["id"], product["stock"])
+            pipe.hset(PRICE_KEY, product["id"], product["price"])
+        pipe.execute()
+
+    def set_product(self, product: dict):
+        pipe = self.client.pipeline(STOCK_KEY)
+        pipe.hset(STOCK_KEY, product["id"], product["stock"])
+        pipe.hset(PRICE_KEY, product["id"], product["price"])
+        pipe.execute()
+
+    def remove_product(self, pid: int):
+        pipe = self.client.pipeline(STOCK_KEY)
+        pipe.hdel(STOCK_KEY, pid)
+        pipe.hdel(PRICE_KEY, pid)
+        pipe.execute()
+
+    def stock_levels(self, pids) -> dict:
+        """Units left per pid; pids missing from inventory are left out."""
+        pids = list(pids)
+        if not pids:
+            return {}
+        values = self.client.hmget(STOCK_KEY, pids)
+        return {pid: int(value) for pid, value in zip(pids, values) if value is not None}
+
+    def place_order(self, user_id, idempotency: str = None):
+        """Return (order dict, replayed)."""
+        idem = idempotency_key(user_id, idempotency or uuid.uuid4().hex)
+        order_id = uuid.uuid4().hex
+        if self.single_script:
+            result = self._checkout(
+                keys=[STOCK_KEY, PRICE_KEY, cart_key(user_id), order_key(user_id, order_id),
+                      orders_key(user_id), idem],
+                args=[order_id, int(time.time()), IDEMPOTENCY_TTL],
+            )
+            return self._result(result)
+        return self._two_step(user_id, order_id, idem)
+
+    def _two_step(self, user_id, order_id: str, idem: str):
+        if not self.client.set(idem, PENDING + order_id, nx=True, ex=IDEMPOTENCY_LOCK_SECONDS):
+            stored = self.client.get(idem)
+            if stored is not None and stored.startswith(PENDING):
+                # The attempt holding the lock may have placed its order and lost the reply
+                stored = self.client.get(order_key(user_id, stored[len(PENDING):]))
+            if stored is None:
+                raise CheckoutError(409, "Checkout already in progress for this Idempotency-Key")
+            return json.loads(stored), True
+
+        # Only a definite failure releases the lock; an unknown outcome keeps it
+        release = True
+        try:
+            cart = self.client.get(cart_key(user_id))
+            if not cart:
+                raise EmptyCart()
+            reserved = self._reserve(keys=[STOCK_KEY, PRICE_KEY], args=[cart])
+            if reserved[0] != "ok":
+                self._result(reserved)
+            total = reserved[1]
+            try:
+                result = self._place(
+                    keys=[cart_key(user_id), order_key(user_id, order_id), orders_key(user_id), idem],
+                    args=[cart, order_id, total, int(time.time()), IDEMPOTENCY_TTL],
+                )
+            except BreakerOpen:
+                self._restock(keys=[STOCK_KEY], args=[cart])
+                raise
+            except (redis.ConnectionError, redis.TimeoutError):
+                release = False
+                raise
+            if result[0] == "changed":
+                self._restock(keys=[STOCK_KEY], args=[cart])
+                raise CheckoutError(409, "Cart changed during checkout, please retry")
+            release = False
+            return self._result(result)
+        finally:
+            if release:
+                self.client.delete(idem)
+
+    def _result(self, result):
+        status = result[0]
+        if status in ("ok", "replay"):
+            return json.loads(result[1]), status == "replay"
+        if status == "empty":
+            raise EmptyCart()
+        if status == "invalid":
+            raise CheckoutError(400, f"Invalid quantity for product {result[1]}")
+        if status == "unknown":
+            raise CheckoutError(409, f"Unknown product {result[1]}")
+        if status == "stock":
+            raise CheckoutError(409, f"Insufficient stock for product {result[1]} ({result[2]} left)")
+        raise CheckoutError(409, f"Checkout failed: {status}")
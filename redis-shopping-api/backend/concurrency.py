@@ -0,0 +1,222 @@
+"""
+Adaptive concurrency limit with load shedding (ADAPTIVE_CONCURRENCY=1).
+
+When Redis or the repository slows down, requests otherwise pile up inside
+the worker and every one of them gets slower. This middleware caps how many
+requests a worker serves at once and sheds the rest immediately with
+503 + Retry-After.
+
+The cap adapts to observed latency with a gradient, as in Netflix's
+concurrency-limits Gradient2 and Envoy's adaptive concurrency filter:
+
+- latencies are averaged over a short window (at least
+  CONCURRENCY_WINDOW_SECONDS and CONCURRENCY_WINDOW_SAMPLES)
+- the baseline is the no-load latency: the fastest window seen, re-measured
+  every CONCURRENCY_PROBE_SECONDS by admitting only CONCURRENCY_MIN_LIMIT
+  requests for one window (as Envoy's gradient controller does). The probe
+  only runs when the last window already stayed within the minimum, so it
+  never sheds traffic. Under sustained load it is skipped and the baseline
+  drifts toward the recent latency by the smoothing factor instead, so a
+  backend that got slower for good is still accepted over time
+- gradient = clamp(tolerance * baseline / window average, 0.5, 1)
+- new limit = limit * gradient + sqrt(limit), smoothed
+
+While latency stays near the baseline the gradient is 1 and the sqrt(limit)
+headroom lets the limit grow. When latency rises the gradient falls below 1
+and the limit shrinks in proportion. The limit only grows while the worker
+actually uses at least half of it.
+
+Authenticated cart and checkout requests are the priority class: they may use
+the whole limit. Everything else (anonymous browsing) is shed once
+CONCURRENCY_RESERVED of the limit is left, which keeps that share free for
+buyers. A request counts as authenticated only if its Bearer token belongs
+to a session this worker validated recently (ValidatedSessions), so an
+arbitrary Authorization header does not skip shedding.
+
+The current limit is exported as concurrency_limit.
+"""
+
+import math
+import os
+import time
+from collections import OrderedDict
+
+from prometheus_client import Counter, Gauge
+
+from fastlane import respond
+
+CONCURRENCY_INITIAL_LIMIT = float(os.getenv("CONCURRENCY_INITIAL_LIMIT", "20"))
+CONCURRENCY_MIN_LIMIT = float(os.getenv("CONCURRENCY_MIN_LIMIT", "4"))
+CONCURRENCY_MAX_LIMIT = float(os.getenv("CONCURRENCY_MAX_LIMIT", "500"))
+# Latency may exceed the baseline by this factor before the limit shrinks
+CONCURRENCY_TOLERANCE = float(os.getenv("CONCURRENCY_TOLERANCE", "1.5"))
+CONCURRENCY_SMOOTHING = float(os.getenv("CONCURRENCY_SMOOTHING", "0.2"))
+CONCURRENCY_WINDOW_SECONDS = float(os.getenv("CONCURRENCY_WINDOW_SECONDS", "0.1"))
+CONCURRENCY_WINDOW_SAMPLES = int(os.getenv("CONCURRENCY_WINDOW_SAMPLES", "10"))
+# How often the no-load latency is measured again at the minimum limit
+CONCURRENCY_PROBE_SECONDS = float(os.getenv("CONCURRENCY_PROBE_SECONDS", "30"))
+# Share of the limit only priority traffic may use
+CONCURRENCY_RESERVED = float(os.getenv("CONCURRENCY_RESERVED", "0.2"))
+# How long a validated session keeps its requests in the priority class
+CONCURRENCY_SESSION_SECONDS = float(os.getenv("CONCURRENCY_SESSION_SECONDS", "300"))
+
+PRIORITY_PREFIXES = ("/cart", "/checkout")
+SHED_BODY = b'{"detail":"Server busy, try again shortly"}'
+
+concurrency_limit = Gauge(
+    "concurrency_limit",
+    "Adaptive concurrency limit per worker",
+    multiprocess_mode="livesum",
+)
+concurrency_in_flight = Gauge(
+    "concurrency_in_flight",
+    "Requests admitted by the concurrency limiter and still running",
+    multiprocess_mode="livesum",
+)
+concurrency_shed = Counter(
+    "concurrency_shed", "Requests shed by the concurrency limiter", ["priority"]
+)
+
+
+class GradientLimit:
+    """Concurrency limit driven by the ratio of no-load to recent latency."""
+
+    def __init__(self, initial: float = CONCURRENCY_INITIAL_LIMIT,
+                 min_limit: float = CONCURRENCY_MIN_LIMIT, max_limit: float = CONCURRENCY_MAX_LIMIT,
+                 tolerance: float = CONCURRENCY_TOLERANCE, smoothing: float = CONCURRENCY_SMOOTHING,
+                 window_seconds: float = CONCURRENCY_WINDOW_SECONDS,
+                 window_samples: int = CONCURRENCY_WINDOW_SAMPLES,
+                 probe_seconds: float = CONCURRENCY_PROBE_SECONDS):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.window_seconds = window_seconds
+        self.window_samples = window_samples
+        self.probe_seconds = probe_seconds
+        self.baseline = 0.0
+        self.probing = False
+        self._probe_at = time.monotonic() + probe_seconds
+        self._reset_window(time.monotonic())
+        concurrency_limit.set(self.limit)
+
+    @property
+    def current(self) -> float:
+        """What the middleware admits right now: the minimum while probing."""
+        return self.min_limit if self.probing else self.limit
+
+    def _reset_window(self, now: float):
+        self._window_start = now
+        self._window_total = 0.0
+        self._window_count = 0
+        self._window_in_flight = 0
+
+    def sample(self, seconds: float, in_flight: int):
+        now = time.monotonic()
+        if now - seconds < self._window_start:
+            return  # Started before this window (or probe): measured under another limit
+        self._window_total += seconds
+        self._window_count += 1
+        self._window_in_flight = max(self._window_in_flight, in_flight)
+        if self._window_count < self.window_samples or now - self._window_start < self.window_seconds:
+            return
+
+        recent = self._window_total / self._window_count
+        busy = self._window_in_flight
+        self._reset_window(now)
+        self.update(recent, busy, now)
+
+    def update(self, recent: float, in_flight: int, now: float):
+        if self.probing:
+            # Measured at the minimum limit, i.e. without queueing in this worker
+            self.baseline = recent
+            self.probing = False
+            self._probe_at = now + self.probe_seconds
+            return
+        if not self.baseline or recent < self.baseline:
+            self.baseline = recent
+        if now >= self._probe_at:
+            # The baseline only ever falls between probes; re-measure it so a
+            # backend that got slower for good does not look congested forever
+            if in_flight <= self.min_limit:
+                self.probing = True
+                self._reset_window(now)
+                return
+            # Busy: probing would shed real traffic, so creep toward recent instead
+            self.baseline += (recent - self.baseline) * self.smoothing
+            self._probe_at = now + self.probe_seconds
+
+        gradient = max(0.5, min(1.0, self.tolerance * self.baseline / recent))
+        if gradient == 1.0 and in_flight < self.limit / 2:
+            return  # Not using the limit: no evidence that more would be fine
+        target = self.limit * gradient + math.sqrt(self.limit)
+        limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, limit))
+        concurrency_limit.set(self.limit)
+
+
+class ValidatedSessions:
+    """Bearer tokens this worker recently validated, LRU-bounded."""
+
+    def __init__(self, ttl: float = CONCURRENCY_SESSION_SECONDS, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._tokens = OrderedDict()
+
+    def add(self, token: str):
+        self._tokens[token] = time.monotonic() + self.ttl
+        self._tokens.move_to_end(token)
+        if len(self._tokens) > self.max_entries:
+            self._tokens.popitem(last=False)
+
+    def __contains__(self, token: str) -> bool:
+        expires = self._tokens.get(token)
+        return expires is not None and expires > time.monotonic()
+
+
+validated_sessions = ValidatedSessions()
+
+
+def is_priority(scope, sessions: ValidatedSessions = validated_sessions) -> bool:
+    if not scope["path"].startswith(PRIORITY_PREFIXES):
+        return False
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return scheme == "Bearer" and token in sessions
+    return False
+
+
+class AdaptiveConcurrencyMiddleware:
+    """Pure ASGI middleware admitting requests up to GradientLimit.current."""
+
+    def __init__(self, app, limit: GradientLimit = None, reserved: float = CONCURRENCY_RESERVED,
+                 excluded=("/metrics",)):
+        self.app = app
+        self.limit = limit or GradientLimit()
+        self.reserved = reserved
+        self.excluded = set(excluded)
+        self.in_flight = 0
+        self._shed = {True: concurrency_shed.labels("priority"), False: concurrency_shed.labels("browse")}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluded:
+            return await self.app(scope, receive, send)
+
+        priority = is_priority(scope)
+        limit = self.limit.current
+        allowed = limit if priority else limit * (1 - self.reserved)
+        if self.in_flight >= allowed:
+            self._shed[priority].inc()
+            return await respond(send, 503, SHED_BODY, [(b"retry-after", b"1")])
+
+        self.in_flight += 1
+        concurrency_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limit.sample(time.perf_counter() - start, self.in_flight)
+            self.in_flight -= 1
+            concurrency_in_flight.dec()
@@ -0,0 +1,90 @@
+"""
+Event consumer process: python consumer.py
+
+Runs the side effects the API publishes on the event bus (EVENT_BUS=1):
+
+- view / cart: time-decayed popularity (bucket flush and periodic merge)
+- product_put / product_delete: audit log
+- every event: per-day counts per type in analytics:{bus}:<YYYYMMDD>
+
+Run as many as needed; they share the consumer group and split the stream.
+"""
+
+import json
+import logging
+import signal
+import threading
+import time
+from collections import Counter
+
+from events import EventConsumer
+from popularity import POPULARITY_REFRESH_SECONDS, PopularityTracker
+from redis_clients import make_client
+from resilience import CircuitBreaker, GuardedRedis
+
+audit_log = logging.getLogger("audit")
+
+
+def analytics_key(day: str) -> str:
+    return f"analytics:{{bus}}:{day}"
+
+
+def build_consumer(client, **kwargs) -> EventConsumer:
+    popularity = PopularityTracker(client)
+    counts = Counter()
+    refreshed_at = [0.0]
+
+    def track(fields):
+        popularity.record(int(fields["pid"]), fields["t"])
+
+    def audit(fields):
+        audit_log.info(json.dumps(fields, sort_keys=True))
+
+    handlers = {
+        "view": track,
+        "cart": track,
+        "product_put": audit,
+        "product_delete": audit,
+    }
+
+    def count(handler):
+        def wrapped(fields):
+            handler(fields)
+            counts[fields["t"]] += 1
+        return wrapped
+
+    def on_batch():
+        popularity.flush()
+        if counts:
+            key = analytics_key(time.strftime("%Y%m%d", time.gmtime()))
+            pipe = client.pipeline(key, transaction=False)
+            for event, n in counts.items():
+                pipe.hincrby(key, event, n)
+            pipe.expire(key, 90 * 86400)
+            pipe.execute()
+            counts.clear()
+        if time.monotonic() - refreshed_at[0] >= POPULARITY_REFRESH_SECONDS:
+            popularity.refresh()
+            refreshed_at[0] = time.monotonic()
+
+    return EventConsumer(
+        client,
+        {event: count(handler) for event, handler in handlers.items()},
+        on_batch=on_batch,
+        **kwargs,
+    )
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    consumer = build_consumer(GuardedRedis(make_client(0), CircuitBreaker("0")))
+    logging.getLogger("events").info("Consumer %s reading %s", consumer.name, consumer.stream)
+    consumer.run(stop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Event bus on a Redis Stream.
+
+Request handlers call EventBus.publish(), which only appends to an in-memory
+buffer. A background thread sends the buffer every EVENT_FLUSH_SECONDS as one
+pipeline of XADDs, so side effects cost no round trip on the request path.
+
+A separate consumer process (consumer.py) drives an EventConsumer. It reads
+batches with XREADGROUP, runs the handlers, then ACKs the whole batch. Entries
+another consumer left pending for longer than EVENT_CLAIM_IDLE_MS (it crashed
+mid-batch) are taken over with XAUTOCLAIM. A claimed entry that has already
+been delivered more than EVENT_MAX_DELIVERIES times (its handler keeps
+failing) is not run again: it is copied to the dead-letter stream
+(<stream>:dead, same hash tag) and ACKed in one MULTI, so one poison entry
+cannot be retried forever.
+
+Backpressure: every flush also reads XLEN. While the stream holds more than
+EVENT_STREAM_MAX_LEN entries (consumers are down or falling behind),
+publish() sheds events instead of growing the stream without bound.
+Overflowing the local buffer sheds too. Both are counted in
+events_dropped_total.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+import redis
+from prometheus_client import Counter, Gauge
+
+EVENT_STREAM = os.getenv("EVENT_STREAM", "events:{bus}")
+EVENT_GROUP = os.getenv("EVENT_GROUP", "workers")
+EVENT_STREAM_MAX_LEN = int(os.getenv("EVENT_STREAM_MAX_LEN", "100000"))
+EVENT_BUFFER_MAX = int(os.getenv("EVENT_BUFFER_MAX", "10000"))
+EVENT_FLUSH_SECONDS = float(os.getenv("EVENT_FLUSH_SECONDS", "0.2"))
+EVENT_BATCH = int(os.getenv("EVENT_BATCH", "500"))
+# Stays below REDIS_SOCKET_TIMEOUT so a blocking read never looks like a timeout
+EVENT_BLOCK_MS = int(os.getenv("EVENT_BLOCK_MS", "100"))
+EVENT_CLAIM_IDLE_MS = int(os.getenv("EVENT_CLAIM_IDLE_MS", "30000"))
+# Deliveries (first read plus reclaims) before an entry is dead-lettered
+EVENT_MAX_DELIVERIES = int(os.getenv("EVENT_MAX_DELIVERIES", "5"))
+
+logger = logging.getLogger("events")
+
+events_published = Counter("events_published", "Events appended to the stream")
+events_dropped = Counter("events_dropped", "Events shed before reaching the stream", ["reason"])
+events_dead_lettered = Counter(
+    "events_dead_lettered", "Events moved to the dead-letter stream after repeated failures"
+)
+event_stream_length = Gauge(
+    "event_stream_length",
+    "Stream length seen at the last flush",
+    multiprocess_mode="livemax",
+)
+
+
+class EventBus:
+    def __init__(self, client, stream: str = EVENT_STREAM, max_len: int = EVENT_STREAM_MAX_LEN,
+                 buffer_max: int = EVENT_BUFFER_MAX):
+        self.client = client
+        self.stream = stream
+        self.max_len = max_len
+        self.buffer_max = buffer_max
+        self.backpressure = False
+        self._buffer = deque()
+        self._stop = threading.Event()
+        self._thread = None
+        self._dropped = {
+            reason: events_dropped.labels(reason) for reason in ("backpressure", "buffer", "error")
+        }
+
+    def publish(self, event: str, **fields) -> bool:
+        """Queue an event; False if it was shed."""
+        if self.backpressure:
+            self._dropped["backpressure"].inc()
+            return False
+        if len(self._buffer) >= self.buffer_max:
+            self._dropped["buffer"].inc()
+            return False
+        fields["t"] = event
+        self._buffer.append(fields)
+        return True
+
+    def flush(self):
+        batch = []
+        while self._buffer and len(batch) < EVENT_BATCH * 10:
+            batch.append(self._buffer.popleft())
+        pipe = self.client.pipeline(self.stream, transaction=False)
+        for fields in batch:
+            pipe.xadd(self.stream, fields)
+        pipe.xlen(self.stream)
+        try:
+            length = pipe.execute()[-1]
+        except redis.RedisError:
+            self._dropped["error"].inc(len(batch))
+            raise
+        events_published.inc(len(batch))
+        event_stream_length.set(length)
+        self.backpressure = length > self.max_len
+
+    def _run(self):
+        while not self._stop.wait(EVENT_FLUSH_SECONDS):
+            try:
+                while True:
+                    self.flush()
+                    if not self._buffer:
+                        break
+            except redis.RedisError as exc:
+                logger.warning("Event flush failed: %s", exc)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="event-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self.flush()
+        except redis.RedisError:
+            pass
+
+
+class EventConsumer:
+    """One member of a consumer group; handlers map event type -> fn(fields)."""
+
+    def __init__(self, client, handlers: dict, on_batch=None, stream: str = EVENT_STREAM,
+                 group: str = EVENT_GROUP, name: str = None, batch: int = EVENT_BATCH,
+                 block_ms: int = EVENT_BLOCK_MS, claim_idle_ms: int = EVENT_CLAIM_IDLE_MS,
+                 max_deliveries: int = EVENT_MAX_DELIVERIES):
+        self.client = client
+        self.handlers = handlers
+        self.on_batch = on_batch
+        self.stream = stream
+        self.dead_stream = f"{stream}:dead"
+        self.group = group
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch = batch
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self.processed = 0
+        self.dead_lettered = 0
+        self._claim_cursor = "0-0"
+        self._claimed_at = 0.0
+
+    def ensure_group(self):
+        try:
+            self.client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+    def read(self):
+        # A one-command pipeline is routed on the stream key, which a plain
+        # XREADGROUP call (group name first) is not in sharded mode
+        pipe = self.client.pipeline(self.stream, transaction=False)
+        pipe.xreadgroup(self.group, self.name, {self.stream: ">"},
+                        count=self.batch, block=self.block_ms)
+        reply = pipe.execute()[0]
+        return reply[0][1] if reply else []
+
+    def reclaim(self):
+        # Entries a dead consumer read but never ACKed
+        self._claim_cursor, entries, *_ = self.client.xautoclaim(
+            self.stream, self.group, self.name, self.claim_idle_ms,
+            start_id=self._claim_cursor, count=self.batch,
+        )
+        return entries
+
+    def dead_letter(self, entries) -> list:
+        """Move entries delivered more than max_deliveries times; return the rest."""
+        pending = [(entry_id, fields) for entry_id, fields in entries if fields is not None]
+        if not pending:
+            return entries
+        pipe = self.client.pipeline(self.stream, transaction=False)
+        for entry_id, _ in pending:
+            pipe.xpending_range(self.stream, self.group, min=entry_id, max=entry_id, count=1)
+        deliveries = {}
+        for reply in pipe.execute():
+            for info in reply:
+                deliveries[info["message_id"]] = info["times_delivered"]
+
+        dead = {
+            entry_id: fields for entry_id, fields in pending
+            if deliveries.get(entry_id, 0) > self.max_deliveries
+        }
+        if not dead:
+            return entries
+        pipe = self.client.pipeline(self.stream)
+        for entry_id, fields in dead.items():
+            pipe.xadd(self.dead_stream, {**fields, "id": entry_id, "deliveries": deliveries[entry_id]},
+                      maxlen=EVENT_STREAM_MAX_LEN, approximate=True)
+        pipe.xack(self.stream, self.group, *dead)
+        pipe.execute()
+        for entry_id in dead:
+            logger.error("Event %s delivered %d times, moved to %s",
+                         entry_id, deliveries[entry_id], self.dead_stream)
+        events_dead_lettered.inc(len(dead))
+        self.dead_lettered += len(dead)
+        return [(entry_id, fields) for entry_id, fields in entries if entry_id not in dead]
+
+    def process(self, entries) -> int:
+        done = []
+        for entry_id, fields in entries:
+            if fields is None:
+                done.append(entry_id)  # Trimmed away while pending
+                continue
+            handler = self.handlers.get(fields.get("t"))
+            try:
+                if handler is not None:
+                    handler(fields)
+            except Exception:
+                # Left pending: reclaimed and retried after claim_idle_ms, up
+                # to max_deliveries times
+                logger.exception("Event %s failed", entry_id)
+                continue
+            done.append(entry_id)
+        if self.on_batch is not None:
+            self.on_batch()
+        if done:
+            self.client.xack(self.stream, self.group, *done)
+        self.processed += len(done)
+        return len(done)
+
+    def poll(self) -> int:
+        now = time.monotonic()
+        if now - self._claimed_at >= self.claim_idle_ms / 1000:
+            self._claimed_at = now
+            claimed = self.reclaim()
+            if claimed:
+                claimed = self.dead_letter(claimed)
+            if claimed:
+                return self.process(claimed)
+        entries = self.read()
+        return self.process(entries) if entries else 0
+
+    def run(self, stop: threading.Event):
+        self.ensure_group()
+        while not stop.is_set():
+            try:
+                self.poll()
+            except redis.RedisError as exc:
+                logger.warning("Event consumer error: %s", exc)
+                stop.wait(1)
@@ -0,0 +1,247 @@
+"""
+Faceted filtering with Redis bitmap indexes.
+
+Every facet value has a bitmap in cache_db with one bit per product ID:
+
+    facet:{catalog}:category:phones     SETBIT <pid> 1
+    facet:{catalog}:price:50000-100000
+    facet:{catalog}:in_stock:true
+    facet:{catalog}:all                 every indexed product
+
+A query ORs the selected values within a facet, ANDs across facets, and
+counts every known value against the other facets' filters, so the UI can
+show how many products each extra click would leave. It pages through the
+result with BITPOS, all in one script call. A million products is a 125KB
+bitmap per value, so the BITOPs take well under a millisecond each and never
+touch the product store.
+
+All facet keys (and the script's scratch keys) carry the {catalog} hash tag.
+The query reads the known values first and declares every bitmap and scratch
+key it touches in KEYS, as cluster and Redis Functions require. A value is
+dropped from the values set once its last product leaves it, so stale values
+stop showing up (and costing a BITOP) in the counts.
+"""
+
+import json
+import os
+import uuid
+
+from catalog import SUMMARY_KEY
+
+FACET_PREFIX = "facet:{catalog}:"
+FACET_VALUES_KEY = "facet:{catalog}:values"
+FACET_ALL_KEY = "facet:{catalog}:all"
+FACETS = ("category", "price", "in_stock")
+
+# Upper bounds of the price bands; the last band is open-ended
+PRICE_BANDS = tuple(int(b) for b in os.getenv("FACET_PRICE_BANDS", "10000,50000,100000").split(","))
+
+# KEYS: summaries, all-products bitmap, result and count scratch, group and
+#       others scratch per facet (FACETS order), selected value bitmaps,
+#       known value bitmaps
+# ARGV: cursor pid, limit, facets (comma-separated), number selected,
+#       selected "facet:value"..., known "facet:value"...
+QUERY_SCRIPT = """
+if redis.call('EXISTS', KEYS[1], KEYS[2]) < 2 then
+  return false
+end
+local unpack = unpack or table.unpack
+local cursor, limit = tonumber(ARGV[1]), tonumber(ARGV[2])
+local slots, nfacets = {}, 0
+for facet in string.gmatch(ARGV[3], '[^,]+') do
+  slots[facet] = 5 + 2 * nfacets
+  nfacets = nfacets + 1
+end
+local values_at = 5 + 2 * nfacets
+local selected = tonumber(ARGV[4])
+
+local function facet_of(member)
+  return string.match(member, '^([^:]+):')
+end
+
+-- OR the selected values within each facet
+local groups, order = {}, {}
+for i = 1, selected do
+  local facet = facet_of(ARGV[4 + i])
+  if not groups[facet] then
+    groups[facet] = {}
+    order[#order + 1] = facet
+  end
+  table.insert(groups[facet], KEYS[values_at + i - 1])
+end
+for _, facet in ipairs(order) do
+  redis.call('BITOP', 'OR', KEYS[slots[facet]], unpack(groups[facet]))
+end
+
+-- AND across facets (every other facet but `skip`) into `key`
+local function conjunction(key, skip)
+  local keys = {KEYS[2]}
+  for _, facet in ipairs(order) do
+    if facet ~= skip then
+      keys[#keys + 1] = KEYS[slots[facet]]
+    end
+  end
+  if #keys == 1 then
+    return KEYS[2]
+  end
+  redis.call('BITOP', 'AND', key, unpack(keys))
+  return key
+end
+
+local result = conjunction(KEYS[3], nil)
+local total = redis.call('BITCOUNT', result)
+
+-- Count each known value under the filters of the other facets
+local counts, others = {}, {}
+for i = selected + 1, #ARGV - 4 do
+  local member = ARGV[4 + i]
+  local facet = facet_of(member)
+  if not others[facet] then
+    others[facet] = conjunction(KEYS[slots[facet] + 1], facet)
+  end
+  redis.call('BITOP', 'AND', KEYS[4], others[facet], KEYS[values_at + i - 1])
+  counts[#counts + 1] = member
+  counts[#counts + 1] = redis.call('BITCOUNT', KEYS[4])
+end
+
+-- Page: the next `limit` set bits after the cursor
+local items = {}
+local pos = cursor + 1
+while #items < limit do
+  local pid = redis.call('BITPOS', result, 1, pos, -1, 'BIT')
+  if pid < 0 then
+    break
+  end
+  local summary = redis.call('HGET', KEYS[1], pid)
+  if summary then
+    items[#items + 1] = summary
+  end
+  pos = pid + 1
+end
+
+redis.call('DEL', unpack(KEYS, 3, values_at - 1))
+return {total, counts, items, #items == limit and pos - 1 or -1}
+"""
+
+# KEYS: values set, value bitmaps. ARGV: pid, "facet:value" per bitmap
+CLEAR_SCRIPT = """
+for i = 2, #KEYS do
+  redis.call('SETBIT', KEYS[i], ARGV[1], 0)
+  if redis.call('BITCOUNT', KEYS[i]) == 0 then
+    redis.call('DEL', KEYS[i])
+    redis.call('SREM', KEYS[1], ARGV[i])
+  end
+end
+"""
+
+
+def price_band(price: int) -> str:
+    low = 0
+    for high in PRICE_BANDS:
+        if price < high:
+            return f"{low}-{high}"
+        low = high
+    return f"{low}+"
+
+
+def facet_values(product: dict) -> set:
+    return {
+        f"category:{product.get('category', 'other')}",
+        f"price:{price_band(product['price'])}",
+        f"in_stock:{'true' if product.get('stock', 0) > 0 else 'false'}",
+    }
+
+
+def parse_facets(selected) -> list:
+    """Validate "facet:value" filters; raises ValueError on unknown facets."""
+    parsed = []
+    for item in selected:
+        facet, sep, value = item.partition(":")
+        if not sep or not value or facet not in FACETS:
+            raise ValueError(f"facet must be <{'|'.join(FACETS)}>:<value>, got {item!r}")
+        parsed.append(item)
+    return parsed
+
+
+class FacetIndex:
+    def __init__(self, client, load_products, catalog=None):
+        self.client = client
+        self.load_products = load_products
+        # Owns the summaries hash the query reads items from
+        self.catalog = catalog
+        self._query = client.register_script(QUERY_SCRIPT)
+        self._clear = client.register_script(CLEAR_SCRIPT)
+
+    def _index(self, pipe, product: dict):
+        pid = product["id"]
+        values = facet_values(product)
+        for value in values:
+            pipe.setbit(FACET_PREFIX + value, pid, 1)
+        pipe.sadd(FACET_VALUES_KEY, *values)
+        pipe.setbit(FACET_ALL_KEY, pid, 1)
+
+    def build(self, batch: int = 10000):
+        pipe = self.client.pipeline(FACET_ALL_KEY, transaction=False)
+        for product in self.load_products():
+            self._index(pipe, product)
+            if len(pipe) >= batch:
+                pipe.execute()
+        pipe.execute()
+
+    def ensure(self):
+        if not self.client.exists(FACET_ALL_KEY):
+            self.build()
+
+    def _clear_values(self, pid, values):
+        # Drops a value from FACET_VALUES_KEY once its last product is gone
+        values = sorted(values)
+        if values:
+            self._clear(keys=[FACET_VALUES_KEY, *(FACET_PREFIX + v for v in values)], args=[pid, *values])
+
+    def upsert(self, product: dict, previous: dict = None):
+        pipe = self.client.pipeline(FACET_ALL_KEY)
+        self._index(pipe, product)
+        pipe.execute()
+        if previous is not None:
+            self._clear_values(product["id"], facet_values(previous) - facet_values(product))
+
+    def remove(self, product: dict):
+        self.client.setbit(FACET_ALL_KEY, product["id"], 0)
+        self._clear_values(product["id"], facet_values(product))
+
+    def query(self, selected, limit: int = 20, cursor: int = 0) -> dict:
+        """Products matching the filters in ID order, with per-value counts."""
+        known = self.client.smembers(FACET_VALUES_KEY)
+        if not known:
+            # Never built or evicted under allkeys-lru
+            self.build()
+            known = self.client.smembers(FACET_VALUES_KEY)
+        known = sorted(v for v in known if v.partition(":")[0] in FACETS)
+
+        # Every key the script touches is declared, scratch keys included
+        scratch = f"facet:{{catalog}}:tmp:{uuid.uuid4().hex}"
+        keys = [SUMMARY_KEY, FACET_ALL_KEY, f"{scratch}:r", f"{scratch}:c"]
+        for facet in FACETS:
+            keys += [f"{scratch}:g:{facet}", f"{scratch}:o:{facet}"]
+        keys += [FACET_PREFIX + value for value in (*selected, *known)]
+        args = [cursor, limit, ",".join(FACETS), len(selected), *selected, *known]
+        result = self._query(keys=keys, args=args)
+        if result is None:
+            # Summaries or the all-products bitmap evicted on their own
+            if self.catalog is not None:
+                self.catalog.ensure()
+            self.ensure()
+            result = self._query(keys=keys, args=args) or [0, [], [], -1]
+
+        total, flat_counts, items, next_cursor = result
+
+        counts = {facet: {} for facet in FACETS}
+        for member, count in zip(flat_counts[::2], flat_counts[1::2]):
+            facet, _, value = member.partition(":")
+            counts[facet][value] = count
+        return {
+            "total": total,
+            "items": [json.loads(item) for item in items],
+            "facets": counts,
+            "next_cursor": str(next_cursor) if next_cursor >= 0 else None,
+        }
@@ -0,0 +1,60 @@
+"""
+Production server profile:
+
+    gunicorn -c gunicorn.conf.py main:app
+
+One uvicorn worker per core (override with WEB_CONCURRENCY), the app is
+imported once in the master and forked, and Prometheus metrics are written to
+PROMETHEUS_MULTIPROC_DIR so /metrics aggregates every worker.
+"""
+
+import multiprocessing
+import os
+import shutil
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "workers.FastUvicornWorker"
+
+# Import main once, before forking: faster worker (re)starts, shared pages.
+# Redis pools notice the fork and reconnect per worker; background threads
+# are only started from the lifespan hook, i.e. inside each worker.
+preload_app = True
+
+# Must exceed the load balancer's idle timeout when it reuses connections,
+# otherwise requests race the close and surface as 502s
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+backlog = int(os.getenv("BACKLOG", "2048"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "30"))
+# SIGTERM: stop accepting, drain in-flight requests, run lifespan shutdown
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# Recycle workers now and then so slow leaks cannot build up
+max_requests = int(os.getenv("MAX_REQUESTS", "100000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "10000"))
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+accesslog = None
+errorlog = "-"
+
+# Metric files from a previous run would be summed into this one, so start
+# clean. This runs before the app is preloaded, and before prometheus_client
+# is imported anywhere: it picks its storage backend from this variable once.
+_metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus")
+shutil.rmtree(_metrics_dir, ignore_errors=True)
+os.makedirs(_metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Fold the dead worker's metric files into the archive so the directory
+    # (and scrape time) stays bounded as workers are recycled
+    from metrics_multiproc import archive_dead_worker
+
+    archive_dead_worker(worker.pid, _metrics_dir)
+
+
+def when_ready(server):
+    # The app is preloaded and no worker is forked yet: write the search
+    # snapshot here, once, so workers only map it and never race to save it
+    from main import write_search_snapshot
+
+    write_search_snapshot()
@@ -0,0 +1,150 @@
+"""
+Hot-key detection and in-process replication of hot cache entries.
+
+Every lookup is counted in a count-min sketch; a small top-k heap keeps the
+heaviest keys. A key is hot when its estimate is at least HOT_KEY_SHARE of all
+recent lookups (and HOT_KEY_MIN_HITS). Hot keys are copied into a per-worker
+cache with a short TTL, so a promotion hammering one product stops landing on
+a single Redis shard. Counts halve every HOT_KEY_DECAY_SECONDS so yesterday's
+hot key cools down.
+"""
+
+import heapq
+import os
+import time
+
+HOT_KEY_TOP_K = int(os.getenv("HOT_KEY_TOP_K", "32"))
+HOT_KEY_SHARE = float(os.getenv("HOT_KEY_SHARE", "0.05"))
+HOT_KEY_MIN_HITS = int(os.getenv("HOT_KEY_MIN_HITS", "50"))
+HOT_KEY_DECAY_SECONDS = float(os.getenv("HOT_KEY_DECAY_SECONDS", "10"))
+HOT_KEY_TTL = float(os.getenv("HOT_KEY_TTL", "1.0"))
+
+
+class CountMinSketch:
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def add(self, key: str, count: int = 1) -> int:
+        estimate = None
+        for seed, row in enumerate(self.rows):
+            i = hash((seed, key)) % self.width
+            row[i] += count
+            if estimate is None or row[i] < estimate:
+                estimate = row[i]
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return min(row[hash((seed, key)) % self.width] for seed, row in enumerate(self.rows))
+
+    def halve(self):
+        self.rows = [[c >> 1 for c in row] for row in self.rows]
+
+
+class TopK:
+    """Min-heap of the k largest estimates; stale heap entries are skipped lazily."""
+
+    def __init__(self, k: int):
+        self.k = k
+        self.counts = {}
+        self._heap = []
+
+    def offer(self, key: str, estimate: int):
+        if len(self._heap) > 4 * self.k:
+            self._rebuild()
+        if key in self.counts:
+            self.counts[key] = estimate
+            heapq.heappush(self._heap, (estimate, key))
+            return
+        if len(self.counts) < self.k:
+            self.counts[key] = estimate
+            heapq.heappush(self._heap, (estimate, key))
+            return
+        floor_key = self._floor()
+        if estimate > self.counts[floor_key]:
+            del self.counts[floor_key]
+            self.counts[key] = estimate
+            heapq.heappush(self._heap, (estimate, key))
+
+    def _floor(self) -> str:
+        while True:
+            estimate, key = self._heap[0]
+            if self.counts.get(key) == estimate:
+                return key
+            heapq.heappop(self._heap)
+
+    def _rebuild(self):
+        self._heap = [(c, k) for k, c in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def rescale(self, sketch: CountMinSketch):
+        self.counts = {key: sketch.estimate(key) for key in self.counts}
+        self._rebuild()
+
+    def items(self):
+        return sorted(self.counts.items(), key=lambda kv: -kv[1])
+
+
+class HotKeyDetector:
+    def __init__(self, k: int = HOT_KEY_TOP_K, share: float = HOT_KEY_SHARE,
+                 min_hits: int = HOT_KEY_MIN_HITS, decay_seconds: float = HOT_KEY_DECAY_SECONDS):
+        self.sketch = CountMinSketch()
+        self.top = TopK(k)
+        self.share = share
+        self.min_hits = min_hits
+        self.decay_seconds = decay_seconds
+        self.total = 0
+        self._decayed_at = time.monotonic()
+
+    def _threshold(self) -> float:
+        return max(self.min_hits, self.share * self.total)
+
+    def record(self, key: str) -> bool:
+        now = time.monotonic()
+        if now - self._decayed_at >= self.decay_seconds:
+            self.sketch.halve()
+            self.total >>= 1
+            self.top.rescale(self.sketch)
+            self._decayed_at = now
+        self.total += 1
+        estimate = self.sketch.add(key)
+        self.top.offer(key, estimate)
+        return estimate >= self._threshold()
+
+    def hot_keys(self):
+        threshold = self._threshold()
+        return [(key, count) for key, count in self.top.items() if count >= threshold]
+
+
+class LocalCache:
+    """Tiny TTL cache for promoted hot entries; bounded by the top-k size."""
+
+    def __init__(self, ttl: float = HOT_KEY_TTL, max_entries: int = HOT_KEY_TOP_K * 2):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        return value
+
+    def set(self, key: str, value):
+        if len(self._entries) >= self.max_entries and key not in self._entries:
+            now = time.monotonic()
+            self._entries = {k: v for k, v in self._entries.items() if v[0] >= now}
+            if len(self._entries) >= self.max_entries:
+                return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
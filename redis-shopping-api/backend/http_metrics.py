@@ -0,0 +1,141 @@
+"""
+Lean HTTP metrics: a pure-ASGI replacement for the Instrumentator stack.
+
+The Instrumentator builds a Request object, matches the route up front and
+calls every metric closure on every request. This middleware keeps the same
+series names (apart from sampled sizes, below) but does the minimum per
+request:
+
+- label children are resolved once per (handler, method, status) and cached;
+  children for every route's methods with status 200 are created up front
+- the handler is read from the route FastAPI already matched (scope["route"]),
+  so there is no second route match
+- request/response sizes are only observed for a sample of requests
+  (METRICS_SIZE_SAMPLE_RATE), taken from Content-Length headers. Below a rate
+  of 1 they go to http_{request,response}_size_sampled_bytes instead, so a
+  dashboard on the full-mode _count series never silently sees a tenth of
+  the traffic. Divide their _count by the rate to estimate requests.
+- the in-progress gauge is labelled by method only, since the handler is not
+  known until routing is done
+"""
+
+import os
+import random
+import time
+
+from prometheus_client import Gauge, Histogram, Summary
+
+METRICS_SIZE_SAMPLE_RATE = float(os.getenv("METRICS_SIZE_SAMPLE_RATE", "0.1"))
+
+HTTP_LATENCY_BUCKETS = (
+    0.001,  # 1ms   - Ultra-fast cache hits
+    0.005,  # 5ms   - Very fast responses
+    0.01,   # 10ms  - Fast responses
+    0.025,  # 25ms  - Quick responses
+    0.05,   # 50ms  - Normal responses
+    0.1,    # 100ms - Acceptable responses
+    0.25,   # 250ms - Slower responses
+    0.5,    # 500ms - Slow responses
+    1.0,    # 1s    - Very slow responses
+    2.5,    # 2.5s  - Extremely slow
+    5.0,    # 5s    - Timeout territory
+    10.0,   # 10s   - Severe issues
+)
+
+
+class LeanHTTPMetrics:
+    """ASGI middleware recording http_request_duration_seconds and friends."""
+
+    def __init__(self, app, routes=(), excluded=("/metrics",),
+                 size_sample_rate: float = METRICS_SIZE_SAMPLE_RATE):
+        self.app = app
+        self.excluded = set(excluded)
+        self.size_sample_rate = size_sample_rate
+        self.latency = Histogram(
+            "http_request_duration_seconds",
+            "Duration of HTTP requests in seconds",
+            ["handler", "method", "status"],
+            buckets=HTTP_LATENCY_BUCKETS,
+        )
+        sampled = "_sampled" if size_sample_rate < 1 else ""
+        self.request_size = Summary(
+            f"http_request_size{sampled}_bytes",
+            "Content length of incoming requests by handler (sampled)",
+            ["handler", "method", "status"],
+        )
+        self.response_size = Summary(
+            f"http_response_size{sampled}_bytes",
+            "Content length of outgoing responses by handler (sampled)",
+            ["handler", "method", "status"],
+        )
+        self.inprogress = Gauge(
+            "http_requests_inprogress",
+            "Number of HTTP requests in progress",
+            ["method"],
+            multiprocess_mode="livesum",
+        )
+        self._children = {}
+        self._inprogress_children = {}
+        # The route list is live: routes registered after the middleware was
+        # added are still here when the middleware stack is built
+        for route in routes:
+            path = getattr(route, "path", None)
+            if path is None or path in self.excluded:
+                continue
+            for method in getattr(route, "methods", None) or ():
+                self._child(path, method, 200)
+
+    def _child(self, handler: str, method: str, status: int):
+        key = (handler, method, status)
+        children = self._children.get(key)
+        if children is None:
+            labels = (handler, method, str(status))
+            children = self._children[key] = (
+                self.latency.labels(*labels),
+                self.request_size.labels(*labels),
+                self.response_size.labels(*labels),
+            )
+        return children
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluded:
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        inprogress = self._inprogress_children.get(method)
+        if inprogress is None:
+            inprogress = self._inprogress_children[method] = self.inprogress.labels(method)
+        sampled = random.random() < self.size_sample_rate
+        state = [500, 0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state[0] = message["status"]
+                if sampled:
+                    for name, value in message.get("headers", ()):
+                        if name == b"content-length":
+                            state[1] = int(value)
+                            break
+            await send(message)
+
+        inprogress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            inprogress.dec()
+            route = scope.get("route")
+            handler = route.path if route is not None else "none"
+            latency, request_size, response_size = self._child(handler, method, state[0])
+            latency.observe(elapsed)
+            if sampled:
+                request_size.observe(_content_length(scope))
+                response_size.observe(state[1])
+
+
+def _content_length(scope) -> int:
+    for name, value in scope["headers"]:
+        if name == b"content-length":
+            return int(value)
+    return 0
@@ -0,0 +1,65 @@
+"""
+Redis key layout.
+
+Every key carries a hash tag ({...}) so that keys which are touched together
+by one script or pipeline land in the same Redis Cluster slot (and on the same
+node when sharding client-side). Per-user keys are tagged with the user id,
+per-client rate-limit keys with the client identity.
+"""
+
+HOMEPAGE_KEY = "homepage:{catalog}"
+# Inventory used by checkout, in cart_db next to the carts
+STOCK_KEY = "stock:{catalog}"
+PRICE_KEY = "prices:{catalog}"
+# Admin product writes over the seed catalog, shared by every worker (cart_db)
+PRODUCT_WRITES_KEY = "product_writes:{catalog}"
+PRODUCT_VERSION_KEY = "product_writes:{catalog}:version"
+
+
+def hash_tag(key: str) -> str:
+    # Same rule as Redis Cluster: hash only the first non-empty {...} section
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def product_key(pid: int) -> str:
+    return f"product:{{{pid}}}"
+
+
+def session_key(token: str) -> str:
+    return f"session:{{{token}}}"
+
+
+def login_attempt_key(email: str) -> str:
+    return f"login_attempt:{{{email}}}"
+
+
+def rate_limit_key(identity: str, window: str) -> str:
+    # All of one caller's quota windows share a slot
+    return f"ratelimit:{{{identity}}}:{window}"
+
+
+def cart_key(user_id) -> str:
+    return f"cart:{{{user_id}}}"
+
+
+def reservation_key(user_id) -> str:
+    # Lives next to cart:{user_id} so cart + reservation scripts stay single-slot
+    return f"reservation:{{{user_id}}}"
+
+
+def order_key(user_id, order_id: str) -> str:
+    return f"order:{{{user_id}}}:{order_id}"
+
+
+def orders_key(user_id) -> str:
+    return f"orders:{{{user_id}}}"
+
+
+def idempotency_key(user_id, key: str) -> str:
+    # Scoped per user: one client's key can never replay another user's order
+    return f"idempotency:{{{user_id}}}:{key}"
@@ -1,21 +1,214 @@
+import hmac
 import json
+import os
 import uuid
-import time
 import asyncio
+from contextlib import asynccontextmanager
 
 import redis
-from fastapi import FastAPI, HTTPException, Request, Depends
+from fastapi import FastAPI, HTTPException, Path, Query, Request, Response, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
 from prometheus_fastapi_instrumentator import Instrumentator, metrics
 
-app = FastAPI(title="Redis Shopping API")
+from bloom import ProductBloom
+from carts import GUEST_COOKIE, GuestCarts, guest_owner, new_guest_id, valid_guest_id
+from catalog import SORTS, CatalogIndex
+from checkout import Checkout, CheckoutError, EmptyCart
+from concurrency import AdaptiveConcurrencyMiddleware, validated_sessions
+from events import EventBus
+from facets import FacetIndex, parse_facets
+from fastlane import FastLaneMiddleware, FastLanes
+from hotkeys import HotKeyDetector, LocalCache
+from http_metrics import HTTP_LATENCY_BUCKETS, LeanHTTPMetrics
+from keys import (
+    HOMEPAGE_KEY,
+    cart_key,
+    login_attempt_key,
+    product_key,
+    session_key,
+)
+from persistence import CART_STORE, CartStore
+from popularity import PopularityTracker
+from profiler import ProfilerBusy, SamplingProfiler, collapsed
+from quotas import QuotaHeaders, QuotaLimiter
+from redis_clients import make_client
+from redis_metrics import RedisRequestMetrics, record_cache
+from replicas import make_reader
+from repository import ProductRepository
+from resilience import CircuitBreaker, GuardedRedis, LocalRateLimiter
+from search import SearchSync, load_or_build
+from simulation import load_profile
+from tracing import TracingMiddleware, response_class, shutdown_tracing, span
+from watchdog import LoopWatchdog
+
+# Degraded mode: how many requests may hit the repository at once while the
+# cache breaker is open, and how long a request waits for a slot
+DEGRADED_REPOSITORY_CONCURRENCY = int(os.getenv("DEGRADED_REPOSITORY_CONCURRENCY", "8"))
+DEGRADED_REPOSITORY_WAIT = float(os.getenv("DEGRADED_REPOSITORY_WAIT", "0.5"))
+
+# Product IDs that do not exist are cached briefly so scans skip the slow path;
+# PRODUCT_BLOOM=1 also rejects them up front with a bloom filter of valid IDs
+NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", "30"))
+PRODUCT_BLOOM = os.getenv("PRODUCT_BLOOM", "0") == "1"
+MISSING = "__missing__"
+
+# FAST_LANE=1 answers cache hits on /product/{pid} and /homepage below FastAPI
+FAST_LANE = os.getenv("FAST_LANE", "0") == "1"
+
+# Largest page /products hands out
+PRODUCTS_MAX_PAGE = int(os.getenv("PRODUCTS_MAX_PAGE", "100"))
+
+# Search index snapshot; workers map it instead of rebuilding ("" keeps it in memory only)
+SEARCH_SNAPSHOT = os.getenv("SEARCH_SNAPSHOT", "")
+
+# EVENT_BUS=1 publishes side effects (popularity, audit, analytics) to a Redis
+# stream for consumer.py instead of applying them in the API process
+EVENT_BUS = os.getenv("EVENT_BUS", "0") == "1"
+
+# How many products the homepage features, picked by decayed popularity
+FEATURED_COUNT = int(os.getenv("FEATURED_COUNT", "4"))
+
+# Carts expire from Redis after this long without changes
+CART_TTL = int(os.getenv("CART_TTL", "3600"))
+# Most units of one product a single /cart/add may ask for
+CART_MAX_QTY = int(os.getenv("CART_MAX_QTY", "99"))
+# Lifetime of the anonymous cart cookie
+GUEST_CART_COOKIE_AGE = int(os.getenv("GUEST_CART_COOKIE_AGE", str(7 * 86400)))
+
+# ADAPTIVE_CONCURRENCY=1 caps in-flight requests per worker from observed
+# latency and sheds the excess (browsing first) with 503
+ADAPTIVE_CONCURRENCY = os.getenv("ADAPTIVE_CONCURRENCY", "0") == "1"
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(product_search.load)
+    product_search.start()
+    cache_reader.start()
+    loop_watchdog.start()
+    try:
+        # Inventory first: the indexes take their stock from it
+        checkout_flow.ensure()
+    except redis.RedisError:
+        pass
+    try:
+        catalog.ensure()
+        facet_index.ensure()
+    except redis.RedisError:
+        pass  # Built on the first /products request instead
+    if product_bloom is not None:
+        product_bloom.start()
+    if cart_store is not None:
+        cart_store.start()
+    if EVENT_BUS:
+        event_bus.start()
+    else:
+        popularity.start()
+    yield
+    if EVENT_BUS:
+        event_bus.stop()
+    else:
+        popularity.stop()
+    if product_bloom is not None:
+        product_bloom.stop()
+    if cart_store is not None:
+        cart_store.stop()
+    loop_watchdog.stop()
+    cache_reader.stop()
+    shutdown_tracing()
+    product_search.stop()
+    # Requests are drained by now; release Redis connections
+    for client in (cache_db, session_db, ratelimit_db, cart_db):
+        client.close()
+
+
+app = FastAPI(
+    title="Redis Shopping API",
+    lifespan=lifespan,
+    default_response_class=response_class,
+)
+
+
+def connect(db: int):
+    # Every logical DB gets its own circuit breaker
+    return GuardedRedis(make_client(db), CircuitBreaker(str(db)))
+
+
+# Redis connections (standalone, cluster or client-side sharded, see REDIS_MODE)
+cache_db = connect(0)
+session_db = connect(1)
+ratelimit_db = connect(2)
+cart_db = connect(3)
+
+# Cache reads tolerate slight staleness, so they may be served by replicas
+cache_reader = make_reader(cache_db, 0)
+
+# Simulated backend latency; empty (true speed) unless APP_MODE=demo or LATENCY_PROFILE
+latency = load_profile()
+
+local_limiter = LocalRateLimiter()
+# Burst / minute / day quotas per API key, user or IP
+quotas = QuotaLimiter(ratelimit_db, local_limiter)
+profiler = SamplingProfiler()
+loop_watchdog = LoopWatchdog()
+
+# Hot product keys get a short-lived copy in this worker (carts are only counted)
+hot_keys = HotKeyDetector()
+hot_cache = LocalCache()
+
+product_bloom = ProductBloom(
+    cache_db, lambda: [p["id"] for p in product_repository.all()]
+) if PRODUCT_BLOOM else None
+repository_slots = asyncio.Semaphore(DEGRADED_REPOSITORY_CONCURRENCY)
+
+# Sorted-set indexes behind /products, kept in sync on product writes
+catalog = CatalogIndex(cache_db, lambda: repository_products())
+facet_index = FacetIndex(cache_db, lambda: repository_products(), catalog)
+
+# Orders and inventory (stock:{catalog}) in cart_db
+checkout_flow = Checkout(cart_db, lambda: product_repository.all())
+
+# Anonymous carts (cookie), merged into the user's cart on login
+guest_carts = GuestCarts(cart_db)
+
+# Write-behind copy of carts and orders (CART_STORE=<sqlite path>), so an
+# evicted cart is reloaded instead of lost
+cart_store = CartStore(CART_STORE) if CART_STORE else None
+
+# View / add-to-cart events, batched in memory and flushed in the background
+popularity = PopularityTracker(cache_db)
+event_bus = EventBus(cache_db)
+
+# Fast-lane handlers, registered next to their FastAPI routes
+fast_lanes = FastLanes()
+
+
+@app.exception_handler(redis.RedisError)
+async def redis_unavailable(request: Request, exc: redis.RedisError):
+    # Breaker open or Redis timed out: fail fast instead of hanging
+    return JSONResponse(
+        {"detail": "Service temporarily unavailable"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+
+# Added first so it sits innermost: metrics, Redis counters and tracing still
+# see fast-lane requests
+if FAST_LANE:
+    app.add_middleware(FastLaneMiddleware, lanes=fast_lanes, routes=app.routes)
+
+# X-RateLimit-* on admitted requests, fast lane included
+app.add_middleware(QuotaHeaders)
 
-# Redis connections
-cache_db = redis.Redis(host="redis", port=6379, db=0, decode_responses=True)
-session_db = redis.Redis(host="redis", port=6379, db=1, decode_responses=True)
-ratelimit_db = redis.Redis(host="redis", port=6379, db=2, decode_responses=True)
-cart_db = redis.Redis(host="redis", port=6379, db=3, decode_responses=True)
+# HTTP metrics: "full" runs the Instrumentator stack, "lean" a single pure-ASGI
+# middleware with cached label children and sampled sizes, "off" records none.
+# /metrics is exposed in every mode.
+METRICS_MODE = os.getenv("METRICS_MODE", "full")
 
-# Configure Prometheus with custom histogram buckets
 instrumentator = Instrumentator(
     should_group_status_codes=False,
     should_ignore_untemplated=False,
@@ -26,59 +219,65 @@ instrumentator = Instrumentator(
     inprogress_labels=True
 )
 
-# Add custom latency metric with fine-grained buckets for API response tracking
-instrumentator.add(
-    metrics.latency(
-        buckets=(
-            0.001,  # 1ms   - Ultra-fast cache hits
-            0.005,  # 5ms   - Very fast responses
-            0.01,   # 10ms  - Fast responses
-            0.025,  # 25ms  - Quick responses
-            0.05,   # 50ms  - Normal responses
-            0.1,    # 100ms - Acceptable responses
-            0.25,   # 250ms - Slower responses
-            0.5,    # 500ms - Slow responses
-            1.0,    # 1s    - Very slow responses
-            2.5,    # 2.5s  - Extremely slow
-            5.0,    # 5s    - Timeout territory
-            10.0,   # 10s   - Severe issues
-        ),
-        should_include_handler=True,
-        should_include_method=True,
-        should_include_status=True,
-        metric_name="http_request_duration_seconds",
-        metric_doc="Duration of HTTP requests in seconds"
+if METRICS_MODE == "full":
+    # Add custom latency metric with fine-grained buckets for API response tracking
+    instrumentator.add(
+        metrics.latency(
+            buckets=HTTP_LATENCY_BUCKETS,
+            should_include_handler=True,
+            should_include_method=True,
+            should_include_status=True,
+            metric_name="http_request_duration_seconds",
+            metric_doc="Duration of HTTP requests in seconds"
+        )
     )
-)
 
-# Add request/response size tracking
-instrumentator.add(
-    metrics.request_size(
-        should_include_handler=True,
-        should_include_method=True,
-        should_include_status=True,
-        metric_namespace="",
-        metric_subsystem="",
-    )
-).add(
-    metrics.response_size(
-        should_include_handler=True,
-        should_include_method=True,
-        should_include_status=True,
-        metric_namespace="",
-        metric_subsystem="",
+    # Add request/response size tracking
+    instrumentator.add(
+        metrics.request_size(
+            should_include_handler=True,
+            should_include_method=True,
+            should_include_status=True,
+            metric_namespace="",
+            metric_subsystem="",
+        )
+    ).add(
+        metrics.response_size(
+            should_include_handler=True,
+            should_include_method=True,
+            should_include_status=True,
+            metric_namespace="",
+            metric_subsystem="",
+        )
     )
-)
 
-# Instrument the FastAPI app and expose /metrics endpoint
-instrumentator.instrument(app).expose(app, endpoint="/metrics", include_in_schema=True)
+    instrumentator.instrument(app)
+elif METRICS_MODE == "lean":
+    app.add_middleware(LeanHTTPMetrics, routes=app.routes)
+
+instrumentator.expose(app, endpoint="/metrics", include_in_schema=True)
+
+# Count Redis round trips per request (redis_commands_per_request)
+app.add_middleware(RedisRequestMetrics)
+# Root span per request when OTEL_TRACING=1
+app.add_middleware(TracingMiddleware)
+# Outermost, so a shed request costs no work further in
+if ADAPTIVE_CONCURRENCY:
+    app.add_middleware(AdaptiveConcurrencyMiddleware)
 
 # Fake data
 FAKE_PRODUCTS = {
-    1: {"id": 1, "name": "iPhone 15", "price": 80000, "stock": 5},
-    2: {"id": 2, "name": "MacBook Pro", "price": 180000, "stock": 3},
+    1: {"id": 1, "name": "iPhone 15", "price": 80000, "stock": 5, "category": "phones"},
+    2: {"id": 2, "name": "MacBook Pro", "price": 180000, "stock": 3, "category": "laptops"},
 }
 
+# Seed catalog plus admin writes, shared by every worker through cart_db
+product_repository = ProductRepository(cart_db, FAKE_PRODUCTS)
+
+# Inverted index over product names; loaded (or built) on startup and rebuilt
+# when another worker writes a product
+product_search = SearchSync(product_repository, SEARCH_SNAPSHOT)
+
 FAKE_USERS = {"user@example.com": {"id": 101, "password": "password123"}}
 
 HOMEPAGE_DATA = {
@@ -87,33 +286,118 @@ HOMEPAGE_DATA = {
 }
 
 
-def db_get_product(pid: int):
-    time.sleep(0.1)  # Simulate database query
-    return FAKE_PRODUCTS.get(pid)
+def write_search_snapshot():
+    # Called once by the gunicorn master before forking; workers only map it
+    if SEARCH_SNAPSHOT:
+        load_or_build(SEARCH_SNAPSHOT, product_repository.all, save=True)
+
+
+def with_live_stock(products: list) -> list:
+    # Checkout only decrements stock:{catalog}; the repository keeps the seed
+    try:
+        levels = checkout_flow.stock_levels(p["id"] for p in products)
+    except redis.RedisError:
+        return products
+    return [{**p, "stock": levels.get(p["id"], p["stock"])} for p in products]
+
+
+def repository_products() -> list:
+    return with_live_stock(product_repository.all())
+
+
+async def db_get_product(pid: int):
+    with span("db_get_product", pid=pid):
+        await latency.delay("db_get_product")  # Simulate database query
+        product = product_repository.get(pid)
+        return with_live_stock([product])[0] if product else None
+
+
+def cache_get(key: str, family: str):
+    # An unavailable cache is just a miss
+    with span("cache.get", family=family) as s:
+        try:
+            value, stale = cache_reader.read(key)
+        except redis.RedisError:
+            record_cache(family, "bypass")
+            return None
+        result = "miss" if value is None else "stale" if stale else "hit"
+        if s is not None:
+            s.set_attribute("cache.result", result)
+        record_cache(family, result)
+        return value
+
+
+def cache_set(key: str, value: str, ex: int):
+    try:
+        cache_db.set(key, value, ex=ex)
+    except redis.RedisError:
+        pass
+
+
+def hot_lookup(key: str, family: str):
+    # Count the access; a hot key may already have a copy in this worker
+    hot = hot_keys.record(key)
+    if hot:
+        value = hot_cache.get(key)
+        if value is not None:
+            record_cache(family, "local")
+            return True, value
+    return hot, None
+
+
+@asynccontextmanager
+async def repository_access():
+    # With the cache breaker open every request reaches the repository, so cap
+    # how many may do so at once and shed the rest quickly
+    if cache_db.breaker.closed:
+        yield
+        return
+    try:
+        await asyncio.wait_for(repository_slots.acquire(), DEGRADED_REPOSITORY_WAIT)
+    except asyncio.TimeoutError:
+        raise HTTPException(503, "Degraded mode, try again shortly", headers={"Retry-After": "1"})
+    try:
+        yield
+    finally:
+        repository_slots.release()
+
+
+def check_rate_limit(scope, user_id=None):
+    # API key, then user ID, then IP; every quota window checked in one script
+    caller = quotas.identify(scope, user_id)
+    if caller is None:
+        raise HTTPException(401, "Invalid API key")
+
+    with span("rate_limit"):
+        quota = quotas.hit(*caller)
+
+    if not quota.allowed:
+        raise HTTPException(429, f"Rate limit exceeded. Retry in {quota.retry_after}s",
+                            headers=quota.headers())
+    # Picked up by QuotaHeaders on the way out
+    scope.setdefault("state", {})["quota"] = quota
 
 
-async def rate_limit(request: Request, limit: int = 10, seconds: int = 60):
-    ip = request.client.host
-    route = request.url.path
-    key = f"ratelimit:{ip}:{route}"
+def fast_lane_missed(request: Request) -> bool:
+    # The fast lane already rate limited this request and missed the cache
+    return request.scope.get("state", {}).get("fast_lane") == "miss"
 
-    hits = ratelimit_db.incr(key)
-    if hits == 1:
-        ratelimit_db.expire(key, seconds)
 
-    if hits > limit:
-        ttl = ratelimit_db.ttl(key)
-        raise HTTPException(429, f"Rate limit exceeded. Retry in {ttl}s")
+async def rate_limit(request: Request, user_id=None):
+    if fast_lane_missed(request):
+        return
+    check_rate_limit(request.scope, user_id)
 
 
 def create_session(user_id: int):
     token = str(uuid.uuid4())
-    session_db.set(f"session:{token}", json.dumps({"user_id": user_id}), ex=3600)
+    session_db.set(session_key(token), json.dumps({"user_id": user_id}), ex=3600)
     return token
 
 
 def get_user(token: str):
-    data = session_db.get(f"session:{token}")
+    data = session_db.get(session_key(token))
+    record_cache("session", "hit" if data else "miss")
     return json.loads(data) if data else None
 
 
@@ -123,78 +407,240 @@ async def auth_required(req: Request):
         raise HTTPException(401, "Missing token")
 
     token = header.split()[1]
-    user = get_user(token)
+    with span("auth_required"):
+        user = get_user(token)
     if not user:
         raise HTTPException(401, "Invalid or expired session")
+    if ADAPTIVE_CONCURRENCY:
+        # Only sessions seen valid here get the priority class
+        validated_sessions.add(token)
     return user
 
 
+async def admin_required(req: Request):
+    token = req.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(403, "Admin token required")
+
+
 @app.get("/")
 def root():
     return {"message": "Redis Shopping Dummy API running"}
 
 
+def track(pid: int, event: str):
+    # No round trip either way: buffered in this process until the next flush
+    if EVENT_BUS:
+        event_bus.publish(event, pid=pid)
+    else:
+        popularity.record(pid, event)
+
+
+def lookup_product(pid: int):
+    # IDs the bloom filter has never seen cannot exist
+    if product_bloom is not None and product_bloom.might_contain(pid) is False:
+        raise HTTPException(404)
+
+    # Check the local hot-key copy, then the cache
+    key = product_key(pid)
+    hot, cached = hot_lookup(key, "product")
+    if cached is None:
+        cached = cache_get(key, "product")
+        if cached and hot:
+            hot_cache.set(key, cached)
+    if cached == MISSING:
+        # Negative cache: we looked this ID up recently and it does not exist
+        raise HTTPException(404)
+    if cached:
+        track(pid, "view")
+    return cached
+
+
+def fast_lane_miss(scope):
+    scope.setdefault("state", {})["fast_lane"] = "miss"
+    return None
+
+
+@fast_lanes.get("/product/{pid}")
+async def product_fast_lane(scope, pid: str):
+    if not (pid.isascii() and pid.isdigit()):
+        return None  # Let FastAPI validate it
+    check_rate_limit(scope)
+    cached = lookup_product(int(pid))
+    if not cached:
+        return fast_lane_miss(scope)
+    # The cached value is already JSON: splice it in instead of re-encoding
+    return b'{"source":"redis_db0","data":' + cached.encode() + b"}"
+
+
 @app.get("/product/{pid}")
 async def get_product(pid: int, req: Request):
     await rate_limit(req)
-    key = f"product:{pid}"
+    key = product_key(pid)
 
-    # Check cache first
-    cached = cache_db.get(key)
+    cached = None if fast_lane_missed(req) else lookup_product(pid)
     if cached:
         # Return immediately from cache (fast!)
         return {"source": "redis_db0", "data": json.loads(cached)}
 
-    # Cache miss - sleep 2 seconds before fetching from DB
-    await asyncio.sleep(2)
-    
-    product = db_get_product(pid)
+    # Cache miss - simulated penalty before fetching from DB (demo profile only)
+    await latency.delay("product_miss")
+
+    async with repository_access():
+        product = await db_get_product(pid)
     if not product:
+        cache_set(key, MISSING, ex=NEGATIVE_CACHE_TTL)
         raise HTTPException(404)
 
-    cache_db.set(key, json.dumps(product), ex=120)
+    cache_set(key, json.dumps(product), ex=120)
+    track(pid, "view")
     return {"source": "database", "data": product}
 
 
+@fast_lanes.get("/homepage")
+async def homepage_fast_lane(scope):
+    check_rate_limit(scope)
+    cached = cache_get(HOMEPAGE_KEY, "homepage")
+    if not cached:
+        return fast_lane_miss(scope)
+    return b'{"source":"redis_db0","data":' + cached.encode() + b"}"
+
+
+@app.get("/products")
+async def list_products(req: Request, sort: str = None, order: str = None,
+                        limit: int = 20, cursor: str = None,
+                        facet: list[str] = Query(default=[])):
+    await rate_limit(req)
+    limit = max(1, min(limit, PRODUCTS_MAX_PAGE))
+
+    if facet:
+        # Bitmap facets: OR within a facet, AND across facets, results in ID order
+        try:
+            selected = parse_facets(facet)
+        except ValueError as exc:
+            raise HTTPException(400, str(exc))
+        if sort is not None or order is not None:
+            raise HTTPException(400, "sort and order are not supported with facet; results come in ID order")
+        if cursor is not None and not (cursor.isascii() and cursor.isdigit() and int(cursor) < 2**31):
+            raise HTTPException(400, "Invalid cursor")
+        result = facet_index.query(selected, limit, int(cursor or 0))
+        return {"source": "redis_db0", **result}
+
+    sort, order = sort or "price", order or "asc"
+    if sort not in SORTS:
+        raise HTTPException(400, f"sort must be one of: {', '.join(SORTS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(400, "order must be asc or desc")
+
+    # O(log N + page) from the sorted-set indexes, never a catalog scan
+    try:
+        items, next_cursor = catalog.page(sort, order == "desc", limit, cursor)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+    return {"source": "redis_db0", "items": items, "next_cursor": next_cursor}
+
+
+@app.get("/search")
+async def search(req: Request, q: str, limit: int = 20, rank: str = "none"):
+    await rate_limit(req)
+    if rank not in ("none", "bm25"):
+        raise HTTPException(400, "rank must be none or bm25")
+    limit = max(1, min(limit, PRODUCTS_MAX_PAGE))
+
+    hits = product_search.index.search(q, limit, rank)
+    pids = [pid for pid, _ in hits]
+    try:
+        products = catalog.summaries(pids)
+    except redis.RedisError:
+        products = [p for p in map(product_repository.get, pids) if p is not None]
+    if rank == "bm25":
+        scores = dict(hits)
+        products = [{**product, "score": scores.get(product["id"])} for product in products]
+    return {"query": q, "items": products}
+
+
+@app.get("/search/autocomplete")
+async def autocomplete(req: Request, q: str, limit: int = 10):
+    await rate_limit(req)
+    return {"query": q, "suggestions": product_search.index.complete(q, max(1, min(limit, 50)))}
+
+
+def featured_products():
+    # Trending products; the static list until there are enough events
+    try:
+        featured = popularity.featured(FEATURED_COUNT)
+    except redis.RedisError:
+        featured = []
+    return featured or HOMEPAGE_DATA["featured"]
+
+
 @app.get("/homepage")
 async def homepage(req: Request):
     await rate_limit(req)
     
     # Check cache first
-    cached = cache_db.get("homepage")
+    cached = None if fast_lane_missed(req) else cache_get(HOMEPAGE_KEY, "homepage")
     if cached:
         # Return immediately from cache (fast!)
         return {"source": "redis_db0", "data": json.loads(cached)}
 
-    # Cache miss - sleep 2 seconds before generating
-    await asyncio.sleep(2)
-    time.sleep(0.2)  # Simulate generation
-    
-    cache_db.set("homepage", json.dumps(HOMEPAGE_DATA), ex=30)
-    return {"source": "generated", "data": HOMEPAGE_DATA}
+    # Cache miss - simulated penalty before generating (demo profile only)
+    await latency.delay("homepage_miss")
+    async with repository_access():
+        await latency.delay("homepage_generate")  # Simulate generation
+
+    data = {**HOMEPAGE_DATA, "featured": featured_products()}
+    cache_set(HOMEPAGE_KEY, json.dumps(data), ex=30)
+    return {"source": "generated", "data": data}
+
+
+async def merge_guest_cart(req: Request, response: Response, user_id, body: dict) -> dict:
+    guest_id = req.cookies.get(GUEST_COOKIE)
+    if not valid_guest_id(guest_id):
+        return body
+    owner = guest_owner(guest_id)
+    if cart_store is not None:
+        # Merge what the store knows if Redis evicted either cart
+        await read_cart(owner)
+        await read_cart(user_id)
+
+    # One script folds the guest cart into cart:{user_id}; nothing to replay client-side
+    merged = guest_carts.merge(guest_id, user_id, CART_TTL)
+    response.delete_cookie(GUEST_COOKIE)
+    if merged is None:
+        return body
+    if cart_store is not None:
+        cart_store.record_cart(user_id, merged)
+        cart_store.record_cart(owner, None)
+    return {**body, "cart": json.loads(merged)}
 
 
 @app.post("/login")
-async def login(email: str, password: str):
+async def login(email: str, password: str, req: Request, response: Response):
     # Check session cache first
-    session_key = f"login_attempt:{email}"
-    cached_token = session_db.get(session_key)
+    attempt_key = login_attempt_key(email)
+    cached_token = session_db.get(attempt_key)
     
     if cached_token:
         # Return cached session immediately
-        return {"token": cached_token, "source": "cached"}
-    
-    # Not cached - sleep 2 seconds
-    await asyncio.sleep(2)
+        body = {"token": cached_token, "source": "cached"}
+        if GUEST_COOKIE in req.cookies:
+            session = get_user(cached_token)
+            if session:
+                body = await merge_guest_cart(req, response, session["user_id"], body)
+        return body
     
+    # Not cached - simulated penalty (demo profile only)
+    await latency.delay("login_miss")
+
     user = FAKE_USERS.get(email)
     if not user or user["password"] != password:
         raise HTTPException(401)
 
     token = create_session(user_id=user["id"])
     # Cache the token for quick subsequent logins
-    session_db.set(session_key, token, ex=300)
-    return {"token": token, "source": "new"}
+    session_db.set(attempt_key, token, ex=300)
+    return await merge_guest_cart(req, response, user["id"], {"token": token, "source": "new"})
 
 
 @app.get("/me")
@@ -203,40 +649,213 @@ async def me(session=Depends(auth_required)):
     return {"user_id": session["user_id"]}
 
 
+async def read_cart(user_id):
+    key = cart_key(user_id)
+    cart = cart_db.get(key)
+    if cart is None and cart_store is not None:
+        # Evicted or expired in Redis: put the durable copy back (disk read off the loop)
+        stored = await asyncio.to_thread(cart_store.load_cart, user_id)
+        if stored:
+            record_cache("cart", "rehydrated")
+            if cart_db.set(key, stored, ex=CART_TTL, nx=True):
+                return stored
+            # A newer cart reached Redis first; it wins over the stored copy
+            return cart_db.get(key)
+    record_cache("cart", "hit" if cart else "miss")
+    return cart
+
+
+def save_cart(user_id, cart: str):
+    cart_db.set(cart_key(user_id), cart, ex=CART_TTL)
+    if cart_store is not None:
+        cart_store.record_cart(user_id, cart)
+
+
+async def cart_owner(req: Request):
+    # Logged-in users own cart:{user_id}; anyone else the guest cart in their cookie
+    if "Authorization" in req.headers:
+        session = await auth_required(req)
+        await rate_limit(req, session["user_id"])
+        return session["user_id"]
+    await rate_limit(req)
+    guest_id = req.cookies.get(GUEST_COOKIE)
+    return guest_owner(guest_id) if valid_guest_id(guest_id) else None
+
+
 @app.post("/cart/add")
-async def add_to_cart(pid: int, qty: int = 1, session=Depends(auth_required)):
-    user_id = session["user_id"]
-    key = f"cart:{user_id}"
+async def add_to_cart(response: Response, pid: int, qty: int = Query(1, ge=1, le=CART_MAX_QTY),
+                      user_id=Depends(cart_owner)):
+    if user_id is None:
+        # First add from an anonymous visitor: issue a guest cart
+        guest_id = new_guest_id()
+        user_id = guest_owner(guest_id)
+        response.set_cookie(GUEST_COOKIE, guest_id, max_age=GUEST_CART_COOKIE_AGE,
+                            httponly=True, samesite="lax")
 
     # Check if cart exists in cache
-    cart_data = cart_db.get(key)
+    cart_data = await read_cart(user_id)
     
     if cart_data:
         # Cart exists in cache - fast operation
         cart = json.loads(cart_data)
     else:
-        # New cart - sleep 2 seconds
-        await asyncio.sleep(2)
+        # New cart - simulated penalty (demo profile only)
+        await latency.delay("cart_new")
         cart = []
     
     cart.append({"pid": pid, "qty": qty})
-    cart_db.set(key, json.dumps(cart), ex=3600)
+    save_cart(user_id, json.dumps(cart))
+
+    if product_repository.get(pid) is not None:
+        track(pid, "cart")
     
     return {"message": "Added to cart", "cart": cart}
 
 
 @app.get("/cart")
-async def get_cart(session=Depends(auth_required)):
-    user_id = session["user_id"]
-    key = f"cart:{user_id}"
-
-    # Check cache first
-    cart = cart_db.get(key)
+async def get_cart(user_id=Depends(cart_owner)):
+    if user_id is None:
+        return {"cart": [], "source": "new"}
+    key = cart_key(user_id)
+
+    # Counted for /admin/hotkeys but never copied into the worker: another
+    # worker may change the cart, and a local copy would serve it stale
+    hot_keys.record(key)
+    cart = await read_cart(user_id)
     
     if cart:
         # Return immediately from cache (fast!)
         return {"cart": json.loads(cart), "source": "cached"}
     
-    # No cart in cache - sleep 2 seconds
-    await asyncio.sleep(2)
+    # No cart in cache - simulated penalty (demo profile only)
+    await latency.delay("cart_empty")
     return {"cart": [], "source": "new"}
+
+
+async def place_order(user_id, idempotency: str):
+    try:
+        return checkout_flow.place_order(user_id, idempotency)
+    except EmptyCart:
+        # The cart may only be missing from Redis: reload it and try once more
+        if cart_store is None or not await read_cart(user_id):
+            raise
+        return checkout_flow.place_order(user_id, idempotency)
+
+
+def sync_stock(pids):
+    # Show what is left: cached product, catalog summary and in_stock facet
+    try:
+        levels = checkout_flow.stock_levels(pids)
+        for previous in catalog.summaries(list(levels)):
+            product = {**previous, "stock": levels[previous["id"]]}
+            catalog.upsert(product, previous)
+            facet_index.upsert(product, previous)
+            cache_db.delete(product_key(product["id"]))
+            hot_cache.delete(product_key(product["id"]))
+    except redis.RedisError:
+        pass  # The order stands; the display catches up on the next write or expiry
+
+
+@app.post("/checkout")
+async def checkout(req: Request, session=Depends(auth_required)):
+    user_id = session["user_id"]
+    await rate_limit(req, user_id)
+
+    # Retries with the same key get the stored order back, never a second one
+    idempotency = req.headers.get("Idempotency-Key")
+    if idempotency is not None and not 0 < len(idempotency) <= 128:
+        raise HTTPException(400, "Idempotency-Key must be 1-128 characters")
+    try:
+        order, replayed = await place_order(user_id, idempotency)
+    except CheckoutError as exc:
+        raise HTTPException(exc.status, exc.detail)
+
+    if cart_store is not None and not replayed:
+        cart_store.record_cart(user_id, None)
+        cart_store.record_order(user_id, order)
+    if not replayed:
+        sync_stock({int(item["pid"]) for item in order["items"]})
+    return JSONResponse(
+        {"order": order, "source": "replayed" if replayed else "new"},
+        headers={"Idempotent-Replayed": "true" if replayed else "false"},
+    )
+
+
+@app.get("/admin/profile", dependencies=[Depends(admin_required)], include_in_schema=False)
+async def admin_profile(seconds: float = 10, interval: float = 0.01):
+    # Sample this worker from a thread so the event loop keeps serving (and shows up)
+    try:
+        result = await asyncio.to_thread(profiler.profile, seconds, interval)
+    except ProfilerBusy:
+        raise HTTPException(409, "A profile is already running")
+    return PlainTextResponse(
+        collapsed(result["stacks"]),
+        headers={
+            "X-Profile-Samples": str(result["samples"]),
+            "X-Profile-Overhead": f"{result['overhead_ratio']:.4f}",
+        },
+    )
+
+
+@app.get("/admin/loop-blocks", dependencies=[Depends(admin_required)], include_in_schema=False)
+async def admin_loop_blocks():
+    # Most recent event-loop stalls with the stack that caused them
+    return {"blocks": list(loop_watchdog.recent_blocks)}
+
+
+@app.get("/admin/hotkeys", dependencies=[Depends(admin_required)], include_in_schema=False)
+async def admin_hotkeys():
+    return {
+        "total": hot_keys.total,
+        "hot": [
+            {"key": key, "estimate": count, "local": key in hot_cache}
+            for key, count in hot_keys.hot_keys()
+        ],
+        "top": [{"key": key, "estimate": count} for key, count in hot_keys.top.items()],
+    }
+
+
+@app.put("/admin/products/{pid}", dependencies=[Depends(admin_required)], include_in_schema=False)
+async def admin_put_product(pid: int = Path(ge=1), name: str = Query(min_length=1),
+                            price: int = Query(ge=0), stock: int = Query(0, ge=0),
+                            category: str = "other"):
+    previous = product_repository.get(pid)
+    if previous is not None:
+        previous = with_live_stock([previous])[0]  # As the indexes saw it
+    product = {"id": pid, "name": name, "price": price, "stock": stock, "category": category}
+
+    # The shared repository first: if a later step fails, a retry of the same
+    # PUT finishes the job and no worker serves the old product meanwhile
+    product_repository.put(product)
+    checkout_flow.set_product(product)
+    catalog.upsert(product, previous)
+    facet_index.upsert(product, previous)
+    if product_bloom is not None and previous is None:
+        product_bloom.add(pid)
+    # Drop cached copies last, negative entries included
+    key = product_key(pid)
+    cache_db.delete(key)
+    hot_cache.delete(key)
+    product_search.index.add(pid, name, previous["name"] if previous else None)
+    if EVENT_BUS:
+        event_bus.publish("product_put", pid=pid, name=name, price=price, stock=stock)
+    return {"product": product, "created": previous is None}
+
+
+@app.delete("/admin/products/{pid}", dependencies=[Depends(admin_required)], include_in_schema=False)
+async def admin_delete_product(pid: int = Path(ge=1)):
+    product = product_repository.get(pid)
+    if product is None:
+        raise HTTPException(404)
+    product = with_live_stock([product])[0]
+    product_repository.delete(pid)
+    catalog.remove(product)
+    checkout_flow.remove_product(pid)
+    facet_index.remove(product)
+    key = product_key(pid)
+    cache_db.delete(key)
+    hot_cache.delete(key)
+    product_search.index.remove(pid, product["name"])
+    if EVENT_BUS:
+        event_bus.publish("product_delete", pid=pid)
+    return {"deleted": pid}
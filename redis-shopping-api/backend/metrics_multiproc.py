@@ -0,0 +1,43 @@
+"""
+Housekeeping for Prometheus multiprocess mode.
+
+Each worker writes its metrics to mmap'd files named <type>_<pid>.db in
+PROMETHEUS_MULTIPROC_DIR and /metrics sums them on every scrape. Workers come
+and go (max_requests recycling, crashes), so without cleanup the directory
+grows by a set of files per dead worker and every scrape gets slower.
+
+When a worker exits, the gunicorn master folds its counter/histogram/summary
+files into one <type>_archive.db per type (counters stay monotonic) and drops
+its gauge files (all our gauges are live* modes, which ignore dead pids).
+"""
+
+import glob
+import os
+
+from prometheus_client import multiprocess
+from prometheus_client.mmap_dict import MmapedDict
+
+ARCHIVED_TYPES = ("counter", "histogram", "summary")
+
+
+def archive_dead_worker(pid: int, directory: str = None):
+    directory = directory or os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    multiprocess.mark_process_dead(pid, directory)
+
+    for typ in ARCHIVED_TYPES:
+        path = os.path.join(directory, f"{typ}_{pid}.db")
+        if not os.path.exists(path):
+            continue
+        archive = MmapedDict(os.path.join(directory, f"{typ}_archive.db"))
+        try:
+            for key, value, timestamp, _ in MmapedDict.read_all_values_from_file(path):
+                current, _ = archive.read_value(key)
+                archive.write_value(key, current + value, timestamp)
+        finally:
+            archive.close()
+        os.remove(path)
+
+    # Whatever gauge files are left for this pid belong to non-live modes and
+    # would otherwise be reported forever
+    for path in glob.glob(os.path.join(directory, f"gauge_*_{pid}.db")):
+        os.remove(path)
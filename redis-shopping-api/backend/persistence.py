@@ -0,0 +1,183 @@
+"""
+Durable copy of carts and orders behind Redis (CART_STORE=<sqlite path>).
+
+cart_db runs with allkeys-lru and carts carry a TTL, so Redis may drop a cart
+at any time. Handlers keep writing Redis first. They also hand the new cart to
+CartStore.record_cart(), which only updates an in-memory dict (latest cart
+per user wins). A background thread writes the dict every
+CART_STORE_FLUSH_SECONDS to SQLite, all in one transaction. Orders are queued
+and written the same way.
+
+On a cart miss in Redis, load_cart() reads the pending dict, then SQLite, and
+the caller puts the cart back into Redis (rehydration). An evicted cart then
+costs one local read instead of being lost.
+
+Each cart row keeps the time of the change, and an older write never replaces
+a newer one. Workers that share the file can therefore flush in any order.
+A cleared cart (after checkout) is stored as a row with no cart, so rehydration
+cannot bring back a cart that was already bought.
+
+Write-behind: a crash loses at most the last flush interval.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from prometheus_client import Counter, Gauge
+
+CART_STORE = os.getenv("CART_STORE", "")
+CART_STORE_FLUSH_SECONDS = float(os.getenv("CART_STORE_FLUSH_SECONDS", "1"))
+# Carts untouched for this long are deleted from the store (orders are kept)
+CART_STORE_RETENTION = int(os.getenv("CART_STORE_RETENTION", str(30 * 86400)))
+
+logger = logging.getLogger("persistence")
+
+cart_store_writes = Counter("cart_store_writes", "Cart and order rows written to the store", ["kind"])
+cart_store_pending = Gauge(
+    "cart_store_pending",
+    "Cart and order changes waiting for the next flush",
+    multiprocess_mode="livesum",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS carts (
+    user_id TEXT PRIMARY KEY,
+    cart TEXT,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    body TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_by_user ON orders (user_id, created);
+"""
+
+
+class CartStore:
+    def __init__(self, path: str = CART_STORE, flush_seconds: float = CART_STORE_FLUSH_SECONDS,
+                 retention: int = CART_STORE_RETENTION):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.retention = retention
+        self._carts = {}
+        self._orders = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Not kept: the app is created before gunicorn forks its workers
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+        db.close()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread: reads run in asyncio.to_thread workers, writes in the flusher
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def record_cart(self, user_id, cart):
+        """Queue the user's cart (JSON string, or None once it is cleared)."""
+        with self._lock:
+            self._carts[str(user_id)] = (cart, time.time())
+            cart_store_pending.set(len(self._carts) + len(self._orders))
+
+    def record_order(self, user_id, order: dict):
+        with self._lock:
+            self._orders.append((order["id"], str(user_id), json.dumps(order), time.time()))
+            cart_store_pending.set(len(self._carts) + len(self._orders))
+
+    def load_cart(self, user_id):
+        """Latest known cart JSON for a user, or None."""
+        user_id = str(user_id)
+        with self._lock:
+            pending = self._carts.get(user_id)
+        if pending is not None:
+            return pending[0]
+        row = self._connection().execute(
+            "SELECT cart FROM carts WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def orders(self, user_id, limit: int = 20) -> list:
+        rows = self._connection().execute(
+            "SELECT body FROM orders WHERE user_id = ? ORDER BY created DESC LIMIT ?",
+            (str(user_id), limit),
+        ).fetchall()
+        return [json.loads(body) for body, in rows]
+
+    def flush(self):
+        with self._lock:
+            carts, self._carts = self._carts, {}
+            orders, self._orders = self._orders, []
+            cart_store_pending.set(0)
+        if not carts and not orders:
+            return
+        db = self._connection()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            db.executemany(
+                "INSERT INTO carts (user_id, cart, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET cart = excluded.cart, updated = excluded.updated "
+                "WHERE excluded.updated >= carts.updated",
+                [(user_id, cart, updated) for user_id, (cart, updated) in carts.items()],
+            )
+            db.executemany("INSERT OR IGNORE INTO orders VALUES (?, ?, ?, ?)", orders)
+            db.execute("COMMIT")
+        except sqlite3.Error:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            self._requeue(carts, orders)
+            raise
+        cart_store_writes.labels("cart").inc(len(carts))
+        cart_store_writes.labels("order").inc(len(orders))
+
+    def _requeue(self, carts: dict, orders: list):
+        # Keep a failed batch unless newer changes arrived meanwhile
+        with self._lock:
+            for user_id, change in carts.items():
+                self._carts.setdefault(user_id, change)
+            self._orders[:0] = orders
+            cart_store_pending.set(len(self._carts) + len(self._orders))
+
+    def prune(self):
+        self._connection().execute(
+            "DELETE FROM carts WHERE updated < ?", (time.time() - self.retention,)
+        )
+
+    def _run(self):
+        try:
+            self.prune()
+        except sqlite3.Error as exc:
+            logger.warning("Cart store prune failed: %s", exc)
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except sqlite3.Error as exc:
+                logger.warning("Cart store flush failed: %s", exc)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="cart-store", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_seconds + 5)
+        try:
+            self.flush()
+        except sqlite3.Error as exc:
+            logger.warning("Cart store flush failed: %s", exc)
@@ -0,0 +1,124 @@
+"""
+Time-decayed product popularity from view and add-to-cart events.
+
+Events are summed in process memory and flushed every
+POPULARITY_FLUSH_SECONDS in one pipeline, so tracking costs a dict update on
+the request path and no round trip. Scores land in one ZSET per time bucket
+(popularity:{catalog}:<bucket>). Every POPULARITY_REFRESH_SECONDS the last
+POPULARITY_BUCKETS buckets are merged with ZUNIONSTORE into the catalog's
+popularity index, each weighted 0.5 ** (age / half-life), so yesterday's
+spike fades instead of staying on top forever. Old buckets simply expire.
+
+The catalog price index takes part with weight 0, which keeps every product
+in the merged index (at score 0 if it has no recent events). The union is
+then intersected with the price index, so a product deleted since its events
+were counted does not come back from an older bucket. Union and intersection
+run in one MULTI on the {catalog} slot.
+
+Every worker runs the refresh loop, but a SET NX key that lives for
+POPULARITY_REFRESH_SECONDS lets only the first one merge per interval.
+
+Popularity is approximate: a batch that fails to flush is dropped.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+import redis
+
+from catalog import POPULARITY_INDEX, PRICE_INDEX
+
+POPULARITY_BUCKET_SECONDS = int(os.getenv("POPULARITY_BUCKET_SECONDS", "300"))
+POPULARITY_BUCKETS = int(os.getenv("POPULARITY_BUCKETS", "24"))
+POPULARITY_HALF_LIFE = float(os.getenv("POPULARITY_HALF_LIFE", "1800"))
+POPULARITY_FLUSH_SECONDS = float(os.getenv("POPULARITY_FLUSH_SECONDS", "1"))
+POPULARITY_REFRESH_SECONDS = float(os.getenv("POPULARITY_REFRESH_SECONDS", "30"))
+
+EVENT_WEIGHTS = {"view": 1.0, "cart": 5.0}
+
+logger = logging.getLogger("popularity")
+
+
+MERGE_KEY = "popularity:{catalog}:merge"
+REFRESH_LOCK_KEY = "popularity:{catalog}:refresh"
+
+
+def bucket_key(bucket: int) -> str:
+    return f"popularity:{{catalog}}:{bucket}"
+
+
+class PopularityTracker:
+    def __init__(self, client, bucket_seconds: int = POPULARITY_BUCKET_SECONDS,
+                 buckets: int = POPULARITY_BUCKETS, half_life: float = POPULARITY_HALF_LIFE):
+        self.client = client
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.half_life = half_life
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._refreshed_at = 0.0
+
+    def record(self, pid: int, event: str = "view"):
+        with self._lock:
+            self._pending[pid] += EVENT_WEIGHTS[event]
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return
+        key = bucket_key(int(time.time()) // self.bucket_seconds)
+        pipe = self.client.pipeline(key, transaction=False)
+        for pid, score in pending.items():
+            pipe.zincrby(key, score, pid)
+        # Kept just long enough to take part in every merge that can use it
+        pipe.expire(key, self.bucket_seconds * (self.buckets + 1))
+        pipe.execute()
+
+    def refresh(self) -> bool:
+        """Rebuild the popularity index; False if another worker did so this interval."""
+        lock_ms = max(1, int(POPULARITY_REFRESH_SECONDS * 1000))
+        if not self.client.set(REFRESH_LOCK_KEY, 1, nx=True, px=lock_ms):
+            return False
+        current = int(time.time()) // self.bucket_seconds
+        weights = {PRICE_INDEX: 0}
+        for age in range(self.buckets):
+            weights[bucket_key(current - age)] = 0.5 ** (age * self.bucket_seconds / self.half_life)
+        pipe = self.client.pipeline(POPULARITY_INDEX)
+        pipe.zunionstore(MERGE_KEY, weights, aggregate="SUM")
+        # Only products still in the catalog
+        pipe.zinterstore(POPULARITY_INDEX, {MERGE_KEY: 1, PRICE_INDEX: 0}, aggregate="SUM")
+        pipe.delete(MERGE_KEY)
+        pipe.execute()
+        return True
+
+    def featured(self, count: int) -> list:
+        """Most popular product IDs with a positive decayed score."""
+        top = self.client.zrevrange(POPULARITY_INDEX, 0, count - 1, withscores=True)
+        return [int(pid) for pid, score in top if score > 0]
+
+    def _run(self):
+        while not self._stop.wait(POPULARITY_FLUSH_SECONDS):
+            try:
+                self.flush()
+                if time.monotonic() - self._refreshed_at >= POPULARITY_REFRESH_SECONDS:
+                    self.refresh()
+                    self._refreshed_at = time.monotonic()
+            except redis.RedisError as exc:
+                logger.warning("Popularity flush failed: %s", exc)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="popularity", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self.flush()
+        except redis.RedisError:
+            pass
@@ -0,0 +1,82 @@
+"""
+In-process sampling profiler.
+
+A background thread wakes every `interval` seconds, walks the stack of every
+other thread via sys._current_frames() and counts each stack. Output is the
+collapsed-stack format (one "frame;frame;frame count" line per stack) that
+flamegraph.pl, speedscope and inferno all read.
+
+Overhead is bounded: one run at a time, a floor on the interval and a cap on
+the duration. The sampler only reads frames, so it never pauses the event loop
+beyond the GIL hand-off of each sample.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+PROFILER_MIN_INTERVAL = float(os.getenv("PROFILER_MIN_INTERVAL", "0.005"))
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def profile(self, seconds: float, interval: float) -> dict:
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            return self._sample(
+                min(max(seconds, 0.1), PROFILER_MAX_SECONDS),
+                max(interval, PROFILER_MIN_INTERVAL),
+            )
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, interval: float) -> dict:
+        me = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        sampling_time = 0.0
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            start = time.perf_counter()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(labels))] += 1
+            samples += 1
+            sampling_time += time.perf_counter() - start
+            time.sleep(interval)
+        return {
+            "stacks": stacks,
+            "samples": samples,
+            "seconds": seconds,
+            "overhead_ratio": sampling_time / seconds,
+        }
+
+
+def collapsed(stacks: Counter) -> str:
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
@@ -0,0 +1,184 @@
+"""
+Hierarchical request quotas per caller.
+
+A caller is identified, in order of preference, by:
+
+- X-API-Key: a partner integration, looked up in API_KEYS
+- user ID: on routes that already authenticated the session
+- client IP: everyone else
+
+Each identity has a plan with up to three fixed windows: a per-second burst,
+a per-minute and a per-day limit (QUOTA_PLANS overrides the defaults below).
+One Lua call checks every window. A request is admitted only if every window
+has room, and only then are the counters incremented, so rejected requests do
+not use up the daily quota. The same call returns the remaining count and the
+wait until the blocking windows reset. Those become X-RateLimit-Remaining and
+Retry-After without another round trip.
+
+All of an identity's counters share its hash tag (ratelimit:{<identity>}:...),
+so the script stays single-slot under cluster and sharding.
+
+    API_KEYS='{"<key>": {"tenant": "acme", "plan": "partner"}}'
+    QUOTA_PLANS='{"partner": {"second": 100, "minute": 3000, "day": 1000000}}'
+"""
+
+import json
+import math
+import os
+import time
+from typing import NamedTuple
+
+import redis
+from prometheus_client import Counter
+
+from keys import rate_limit_key
+
+WINDOWS = {"second": 1, "minute": 60, "day": 86400}
+
+DEFAULT_PLANS = {
+    "anonymous": {"second": 5, "minute": 30, "day": 5000},
+    "user": {"second": 10, "minute": 120, "day": 20000},
+    "partner": {"second": 50, "minute": 1000, "day": 500000},
+}
+
+
+def load_plans(raw: str) -> dict:
+    # Overrides are merged per plan, so a plan may change a single window
+    plans = {name: dict(limits) for name, limits in DEFAULT_PLANS.items()}
+    for name, limits in json.loads(raw or "{}").items():
+        plans.setdefault(name, {}).update(limits)
+    return plans
+
+
+QUOTA_PLANS = load_plans(os.getenv("QUOTA_PLANS", ""))
+API_KEYS = json.loads(os.getenv("API_KEYS", "") or "{}")
+
+quota_rejections = Counter(
+    "quota_rejections", "Requests refused by a quota window", ["plan", "window"]
+)
+
+# KEYS: one counter per window. ARGV: limit, seconds until reset (per window)
+QUOTA_SCRIPT = """
+local counts = redis.call('MGET', unpack(KEYS))
+local blocked, retry = 0, 0
+for i = 1, #KEYS do
+  local limit, reset = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+  if tonumber(counts[i] or '0') >= limit then
+    if reset > retry then
+      blocked, retry = i, reset
+    end
+  end
+end
+if blocked > 0 then
+  return {0, blocked, 0, retry}
+end
+local tightest, remaining = 1, nil
+for i, key in ipairs(KEYS) do
+  local limit = tonumber(ARGV[2 * i - 1])
+  local hits = redis.call('INCR', key)
+  if hits == 1 then
+    redis.call('EXPIRE', key, ARGV[2 * i])
+  end
+  if remaining == nil or limit - hits < remaining then
+    tightest, remaining = i, limit - hits
+  end
+end
+return {1, tightest, remaining, 0}
+"""
+
+
+class Quota(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: int
+
+    def headers(self) -> dict:
+        headers = {"X-RateLimit-Limit": str(self.limit), "X-RateLimit-Remaining": str(self.remaining)}
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+def header(scope, name: bytes):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class QuotaLimiter:
+    def __init__(self, client, local_limiter, plans: dict = QUOTA_PLANS, api_keys: dict = API_KEYS):
+        self.client = client
+        self.local_limiter = local_limiter
+        self.plans = plans
+        self.api_keys = api_keys
+        self._script = client.register_script(QUOTA_SCRIPT)
+
+    def identify(self, scope, user_id=None):
+        """(identity, plan) for a request; None for an unknown API key."""
+        api_key = header(scope, b"x-api-key")
+        if api_key is not None:
+            partner = self.api_keys.get(api_key)
+            if partner is None:
+                return None
+            return f"key:{partner['tenant']}", partner.get("plan", "partner")
+        if user_id is not None:
+            return f"user:{user_id}", "user"
+        return f"ip:{scope['client'][0]}", "anonymous"
+
+    def hit(self, identity: str, plan: str) -> Quota:
+        windows = [(name, WINDOWS[name], limit) for name, limit in self.plans[plan].items()]
+        now = time.time()
+        keys, args = [], []
+        for name, seconds, limit in windows:
+            index = int(now // seconds)
+            keys.append(rate_limit_key(identity, f"{name}:{index}"))
+            # Windows are aligned to the clock, so they all reset on a boundary
+            args += [limit, max(1, math.ceil((index + 1) * seconds - now))]
+
+        try:
+            allowed, window, remaining, retry = self._script(keys=keys, args=args)
+        except redis.RedisError:
+            # Redis is down: keep limiting per worker from process memory
+            allowed, window, remaining, retry = self._local_hit(keys, windows)
+
+        name, _, limit = windows[window - 1]
+        if not allowed:
+            quota_rejections.labels(plan, name).inc()
+            return Quota(False, limit, 0, retry)
+        return Quota(True, limit, remaining, 0)
+
+    def _local_hit(self, keys: list, windows: list):
+        tightest, remaining, blocked, retry = 1, None, 0, 0
+        for i, (key, (_, seconds, limit)) in enumerate(zip(keys, windows), 1):
+            hits, ttl = self.local_limiter.hit(key, seconds)
+            if hits > limit and ttl > retry:
+                blocked, retry = i, ttl
+            if remaining is None or limit - hits < remaining:
+                tightest, remaining = i, limit - hits
+        if blocked:
+            return 0, blocked, 0, retry
+        return 1, tightest, remaining, 0
+
+
+class QuotaHeaders:
+    """ASGI middleware adding X-RateLimit-* for requests admitted by a quota."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_with_quota(message):
+            if message["type"] == "http.response.start":
+                quota = scope.get("state", {}).get("quota")
+                if quota is not None and quota.allowed:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (name.lower().encode(), value.encode()) for name, value in quota.headers().items()
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_quota)
@@ -0,0 +1,191 @@
+"""
+Redis client factory.
+
+REDIS_MODE selects the topology:
+  standalone  one server, one logical DB per data type (default)
+  cluster     Redis Cluster; logical DBs collapse into DB 0, keys never collide
+  sharded     client-side consistent hashing across REDIS_NODES standalone servers
+"""
+
+import bisect
+import hashlib
+import os
+
+import redis
+from redis.backoff import NoBackoff
+from redis.cluster import ClusterNode, RedisCluster
+from redis.retry import Retry
+
+from keys import hash_tag
+from redis_metrics import InstrumentedConnectionPool
+
+REDIS_MODE = os.getenv("REDIS_MODE", "standalone")
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+# "host:port,host:port,..." - cluster seed nodes or shard list
+REDIS_NODES = os.getenv("REDIS_NODES", f"{REDIS_HOST}:{REDIS_PORT}")
+# Tight timeouts and no client-side retries: a stalled Redis should trip the
+# circuit breaker quickly instead of holding handlers on the socket
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.25"))
+# Pool size per logical DB and per node, and how long a request may wait for a
+# free connection before failing
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "0.5"))
+
+CLIENT_KWARGS = {
+    "decode_responses": True,
+    "socket_timeout": REDIS_SOCKET_TIMEOUT,
+    "socket_connect_timeout": REDIS_SOCKET_TIMEOUT,
+    "retry": Retry(NoBackoff(), 0),
+}
+
+
+def parse_nodes(spec: str):
+    nodes = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(":")
+        nodes.append((host, int(port)))
+    return nodes
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes, vnodes: int = 160):
+        ring = sorted(
+            (_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes)
+        )
+        self._hashes = [h for h, _ in ring]
+        self._nodes = [n for _, n in ring]
+
+    def node_for(self, key: str):
+        i = bisect.bisect(self._hashes, _hash(hash_tag(key)))
+        return self._nodes[i % len(self._nodes)]
+
+
+class ShardedScript:
+    def __init__(self, sharded, script: str):
+        self._sharded = sharded
+        self._script = script
+        self._per_node = {}
+
+    def __call__(self, keys=(), args=()):
+        node = self._sharded.node_for_keys(keys)
+        script = self._per_node.get(node)
+        if script is None:
+            script = self._sharded.clients[node].register_script(self._script)
+            self._per_node[node] = script
+        return script(keys=keys, args=args)
+
+
+# Commands whose positional arguments are all keys; they must not span shards
+MULTI_KEY_COMMANDS = frozenset({"delete", "unlink", "exists", "touch", "mget", "sinter", "sunion", "sdiff"})
+
+
+def connect_node(host: str, port: int, db: int):
+    pool = InstrumentedConnectionPool(
+        str(db),
+        host=host,
+        port=port,
+        db=db,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        **CLIENT_KWARGS,
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+class ShardedRedis:
+    """
+    Routes single-key commands to one of N standalone servers by the key's
+    hash tag. Scripts and pipelines must only touch keys sharing a tag.
+    """
+
+    def __init__(self, nodes, db: int):
+        self.clients = {
+            f"{host}:{port}": connect_node(host, port, db) for host, port in nodes
+        }
+        self._ring = HashRing(list(self.clients))
+
+    def node_for_keys(self, keys):
+        if not keys:
+            raise redis.RedisError("Sharded scripts need at least one key")
+        nodes = {self._ring.node_for(k) for k in keys}
+        if len(nodes) > 1:
+            raise redis.RedisError(f"Keys {list(keys)} span several shards")
+        return nodes.pop()
+
+    def client_for(self, key: str):
+        return self.clients[self._ring.node_for(key)]
+
+    def pipeline(self, key: str, transaction: bool = True):
+        return self.client_for(key).pipeline(transaction=transaction)
+
+    def register_script(self, script: str):
+        return ShardedScript(self, script)
+
+    def ping(self):
+        return all(c.ping() for c in self.clients.values())
+
+    def close(self):
+        for c in self.clients.values():
+            c.close()
+
+    def zunionstore(self, dest: str, keys, *args, **kwargs):
+        node = self.node_for_keys([dest, *keys])
+        return self.clients[node].zunionstore(dest, keys, *args, **kwargs)
+
+    def zinterstore(self, dest: str, keys, *args, **kwargs):
+        node = self.node_for_keys([dest, *keys])
+        return self.clients[node].zinterstore(dest, keys, *args, **kwargs)
+
+    def __getattr__(self, name):
+        if name in MULTI_KEY_COMMANDS:
+            def multi_key_command(*keys, **kwargs):
+                return getattr(self.clients[self.node_for_keys(keys)], name)(*keys, **kwargs)
+
+            return multi_key_command
+
+        # Everything else is a single-key command routed on its first argument
+        def command(key, *args, **kwargs):
+            return getattr(self.client_for(key), name)(key, *args, **kwargs)
+
+        return command
+
+
+_cluster = None
+
+
+def make_client(db: int):
+    global _cluster
+    if REDIS_MODE == "cluster":
+        # Cluster only has DB 0; all logical DBs share one client. Its node
+        # pools are built by redis-py, so there are no redis_pool_* metrics
+        if _cluster is None:
+            _cluster = RedisCluster(
+                startup_nodes=[ClusterNode(h, p) for h, p in parse_nodes(REDIS_NODES)],
+                **CLIENT_KWARGS,
+            )
+        return _cluster
+    if REDIS_MODE == "sharded":
+        return ShardedRedis(parse_nodes(REDIS_NODES), db)
+    return connect_node(REDIS_HOST, REDIS_PORT, db)
+
+
+def get_bytes(client, key: str):
+    # Binary-safe GET on a decode_responses client
+    if isinstance(client, ShardedRedis):
+        client = client.client_for(key)
+    return client.execute_command("GET", key, NEVER_DECODE=True)
+
+
+def pipeline_for(client, key: str = None, transaction: bool = True):
+    # Sharded clients need the key to pick a node; the others ignore it
+    if isinstance(client, ShardedRedis):
+        return client.pipeline(key, transaction=transaction)
+    return client.pipeline(transaction=transaction)
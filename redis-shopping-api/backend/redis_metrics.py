@@ -0,0 +1,138 @@
+"""
+Redis-level Prometheus metrics, so a p99 regression can be pinned on Redis
+(slow commands, too many round trips, an exhausted pool) or on the app.
+"""
+
+import contextvars
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+from redis import BlockingConnectionPool
+
+REDIS_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0,
+)
+
+redis_command_duration = Histogram(
+    "redis_command_duration_seconds",
+    "Redis command latency as seen by the client",
+    ["db", "command"],
+    buckets=REDIS_BUCKETS,
+)
+redis_commands_per_request = Histogram(
+    "redis_commands_per_request",
+    "Redis round trips made while serving one HTTP request",
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50),
+)
+redis_pipeline_size = Histogram(
+    "redis_pipeline_size",
+    "Commands sent in one pipeline",
+    ["db"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+redis_pool_wait = Histogram(
+    "redis_pool_wait_seconds",
+    "Time spent waiting for a free pooled connection",
+    ["db"],
+    buckets=REDIS_BUCKETS,
+)
+redis_pool_in_use = Gauge(
+    "redis_pool_connections_in_use",
+    "Pooled connections currently checked out",
+    ["db"],
+    multiprocess_mode="livesum",
+)
+redis_pool_saturation = Gauge(
+    "redis_pool_saturation_ratio",
+    "Checked-out connections divided by pool size",
+    ["db"],
+    multiprocess_mode="livemax",
+)
+cache_requests = Counter(
+    "redis_cache_requests",
+    "Cache lookups by key family and result",
+    ["family", "result"],
+)
+
+CACHE_FAMILIES = ("product", "homepage", "session", "cart")
+CACHE_RESULTS = ("hit", "local", "miss", "stale", "bypass", "rehydrated")
+
+# Label children resolved once instead of on every lookup
+_cache_children = {
+    (f, r): cache_requests.labels(f, r) for f in CACHE_FAMILIES for r in CACHE_RESULTS
+}
+_command_children = {}
+
+# Round trips for the current request; a one-element list so threadpool
+# copies of the context still count into the same cell
+_request_commands = contextvars.ContextVar("redis_request_commands", default=None)
+
+
+def record_cache(family: str, result: str):
+    _cache_children[(family, result)].inc()
+
+
+def observe_command(db: str, command: str, seconds: float):
+    child = _command_children.get((db, command))
+    if child is None:
+        child = _command_children[(db, command)] = redis_command_duration.labels(db, command)
+    child.observe(seconds)
+    cell = _request_commands.get()
+    if cell is not None:
+        cell[0] += 1
+
+
+def observe_pipeline(db: str, size: int, seconds: float):
+    redis_pipeline_size.labels(db).observe(size)
+    observe_command(db, "PIPELINE", seconds)
+
+
+class RedisRequestMetrics:
+    """ASGI middleware observing redis_commands_per_request for each HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        cell = [0]
+        token = _request_commands.set(cell)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_commands.reset(token)
+            redis_commands_per_request.observe(cell[0])
+
+
+class InstrumentedConnectionPool(BlockingConnectionPool):
+    """Blocking pool that reports wait time and saturation per logical DB."""
+
+    def __init__(self, label: str, **kwargs):
+        super().__init__(**kwargs)
+        self.label = label
+        self._checked_out = 0
+        self._wait = redis_pool_wait.labels(label)
+        self._in_use = redis_pool_in_use.labels(label)
+        self._saturation = redis_pool_saturation.labels(label)
+
+    def _update(self, delta: int):
+        # Connections are taken from the event loop and from to_thread workers
+        with self._lock:
+            self._checked_out += delta
+            self._in_use.inc(delta)
+            self._saturation.set(self._checked_out / self.max_connections)
+
+    def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            connection = super().get_connection(*args, **kwargs)
+        finally:
+            # Observed on failure too: a pool-exhaustion timeout is the wait that matters
+            self._wait.observe(time.perf_counter() - start)
+        self._update(1)
+        return connection
+
+    def release(self, connection):
+        super().release(connection)
+        self._update(-1)
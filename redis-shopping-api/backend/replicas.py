@@ -0,0 +1,223 @@
+"""
+Replica-aware routing for staleness-tolerant reads (product/homepage cache).
+
+Replicas come from REDIS_REPLICAS ("host:port,...") or are discovered through
+Sentinel (REDIS_SENTINELS + REDIS_SENTINEL_SERVICE). A background thread
+measures replication lag with a heartbeat key and takes lagging or unreachable
+replicas out of the rotation; with no healthy replica reads go to the primary.
+A read counts as stale (result="stale" in redis_cache_requests_total) only if
+its replica is more than REPLICA_STALE_SECONDS behind, so heartbeat jitter
+does not mark every replica read.
+
+In cluster mode a second cluster client reads from replicas. It has its own
+circuit breaker and command metrics (db="<db>-replicas"), and falls back to
+the primary client when it fails.
+
+Writes, rate limits, sessions and carts never use this module.
+"""
+
+import itertools
+import os
+import threading
+import time
+
+import redis
+from prometheus_client import Gauge
+from redis.cluster import ClusterNode, LoadBalancingStrategy, RedisCluster
+from redis.sentinel import Sentinel
+
+from redis_clients import CLIENT_KWARGS, REDIS_MODE, REDIS_NODES, parse_nodes
+from resilience import CircuitBreaker, GuardedRedis
+
+REDIS_REPLICAS = os.getenv("REDIS_REPLICAS", "")
+REDIS_SENTINELS = os.getenv("REDIS_SENTINELS", "")
+REDIS_SENTINEL_SERVICE = os.getenv("REDIS_SENTINEL_SERVICE", "mymaster")
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "1.0"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "1.0"))
+# Lag above which a replica read is reported as stale (it still serves up to the max)
+REPLICA_STALE_SECONDS = float(os.getenv("REPLICA_STALE_SECONDS", str(REPLICA_MAX_LAG_SECONDS / 2)))
+
+HEARTBEAT_KEY = "replication:heartbeat:{catalog}"
+
+replica_lag_seconds = Gauge(
+    "redis_replica_lag_seconds",
+    "Replication lag measured through the heartbeat key",
+    ["replica"],
+    multiprocess_mode="livemax",
+)
+replica_lag_bytes = Gauge(
+    "redis_replica_lag_bytes",
+    "Primary replication offset minus replica offset",
+    ["replica"],
+    multiprocess_mode="livemax",
+)
+replica_healthy = Gauge(
+    "redis_replica_healthy",
+    "1 if the replica is in the read rotation",
+    ["replica"],
+    multiprocess_mode="livemax",
+)
+
+
+class ReplicaRouter:
+    def __init__(self, primary, db: int, replicas=(), sentinel=None):
+        self.primary = primary
+        self.db = db
+        self._static = list(replicas)
+        self._sentinel = sentinel
+        self._clients = {}
+        self._healthy = []
+        self._lag = {}
+        self._rr = itertools.count()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._static or self._sentinel)
+
+    def _discover(self):
+        if self._sentinel is not None:
+            try:
+                return self._sentinel.discover_slaves(REDIS_SENTINEL_SERVICE)
+            except redis.RedisError:
+                return list(self._clients)
+        return self._static
+
+    def _client(self, addr):
+        client = self._clients.get(addr)
+        if client is None:
+            host, port = addr
+            client = redis.Redis(
+                host=host,
+                port=port,
+                db=self.db,
+                **CLIENT_KWARGS,
+            )
+            self._clients[addr] = client
+        return client
+
+    def check(self):
+        # Replicas should hold the heartbeat written one interval ago; anything
+        # older means they are behind by at least the difference
+        now = time.time()
+        try:
+            primary_offset = self.primary.info("replication").get("master_repl_offset", 0)
+        except redis.RedisError:
+            primary_offset = None
+
+        healthy = []
+        lags = {}
+        for addr in self._discover():
+            addr = tuple(addr)
+            name = f"{addr[0]}:{addr[1]}"
+            client = self._client(addr)
+            try:
+                info = client.info("replication")
+                beat = client.get(HEARTBEAT_KEY)
+            except redis.RedisError:
+                replica_healthy.labels(name).set(0)
+                continue
+
+            lag = max(now - float(beat) - REPLICA_CHECK_INTERVAL, 0.0) if beat else float("inf")
+            replica_lag_seconds.labels(name).set(lag)
+            lags[client] = lag
+            if primary_offset is not None:
+                replica_lag_bytes.labels(name).set(
+                    max(primary_offset - info.get("slave_repl_offset", 0), 0)
+                )
+
+            ok = info.get("master_link_status") == "up" and lag <= REPLICA_MAX_LAG_SECONDS
+            replica_healthy.labels(name).set(1 if ok else 0)
+            if ok:
+                healthy.append(client)
+        self._healthy = healthy
+        self._lag = lags
+
+        try:
+            self.primary.set(HEARTBEAT_KEY, repr(time.time()), ex=60)
+        except redis.RedisError:
+            pass
+
+    def reader(self):
+        healthy = self._healthy
+        if not healthy:
+            return self.primary
+        return healthy[next(self._rr) % len(healthy)]
+
+    def read(self, key: str):
+        # Returns (value, stale); stale means a lagging replica answered
+        client = self.reader()
+        if client is self.primary:
+            return self.primary.get(key), False
+        try:
+            return client.get(key), self._lag.get(client, 0.0) > REPLICA_STALE_SECONDS
+        except redis.RedisError:
+            # Drop it until the next health check and fall back to the primary
+            self._healthy = [c for c in self._healthy if c is not client]
+            return self.primary.get(key), False
+
+    def get(self, key: str):
+        return self.read(key)[0]
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception:
+                self._healthy = []
+            self._stop.wait(REPLICA_CHECK_INTERVAL)
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="replica-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for client in self._clients.values():
+            client.close()
+
+
+class ClusterReader:
+    """Cluster mode: a second cluster client that sends reads to replicas."""
+
+    def __init__(self, primary, db: int):
+        self.primary = primary
+        self._client = GuardedRedis(
+            RedisCluster(
+                startup_nodes=[ClusterNode(h, p) for h, p in parse_nodes(REDIS_NODES)],
+                load_balancing_strategy=LoadBalancingStrategy.ROUND_ROBIN_REPLICAS,
+                **CLIENT_KWARGS,
+            ),
+            CircuitBreaker(f"{db}-replicas"),
+        )
+
+    def read(self, key: str):
+        try:
+            return self._client.get(key), False
+        except redis.RedisError:
+            # Replica reads failing (or their breaker open): the primary answers
+            return self.primary.get(key), False
+
+    def get(self, key: str):
+        return self.read(key)[0]
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self._client.close()
+
+
+def make_reader(primary, db: int):
+    if REDIS_MODE == "cluster":
+        return ClusterReader(primary, db)
+    if REDIS_MODE == "sharded":
+        # Per-shard replicas are not modelled; reads stay on the shard primaries
+        return ReplicaRouter(primary, db)
+    sentinel = None
+    if REDIS_SENTINELS:
+        sentinel = Sentinel(parse_nodes(REDIS_SENTINELS), socket_timeout=0.5)
+    return ReplicaRouter(primary, db, parse_nodes(REDIS_REPLICAS), sentinel)
@@ -0,0 +1,65 @@
+"""
+Product repository shared by every worker.
+
+The seed catalog (FAKE_PRODUCTS) is imported by each worker, so writes to it
+would stay in the worker that served the admin request. Admin writes go to
+Redis instead: product_writes:{catalog} in cart_db, next to the inventory,
+maps pid -> product JSON, or "" once the product is deleted. A read checks
+that hash first and falls back to the seed. Every write also increments
+product_writes:{catalog}:version in the same MULTI. Workers holding derived
+state (the search index) compare it with the version they were built from.
+
+If Redis is unreachable, reads fall back to the seed catalog, so the
+repository still answers (without the admin writes) in degraded mode.
+"""
+
+import json
+
+import redis
+
+from keys import PRODUCT_VERSION_KEY, PRODUCT_WRITES_KEY
+
+DELETED = ""
+
+
+class ProductRepository:
+    def __init__(self, client, seed: dict):
+        self.client = client
+        self.seed = seed
+
+    def get(self, pid: int):
+        try:
+            stored = self.client.hget(PRODUCT_WRITES_KEY, pid)
+        except redis.RedisError:
+            stored = None
+        if stored is None:
+            return self.seed.get(pid)
+        return json.loads(stored) if stored != DELETED else None
+
+    def all(self) -> list:
+        try:
+            writes = self.client.hgetall(PRODUCT_WRITES_KEY)
+        except redis.RedisError:
+            writes = {}
+        products = dict(self.seed)
+        for pid, stored in writes.items():
+            if stored == DELETED:
+                products.pop(int(pid), None)
+            else:
+                products[int(pid)] = json.loads(stored)
+        return list(products.values())
+
+    def version(self) -> int:
+        return int(self.client.get(PRODUCT_VERSION_KEY) or 0)
+
+    def _write(self, pid: int, stored: str):
+        pipe = self.client.pipeline(PRODUCT_WRITES_KEY)
+        pipe.hset(PRODUCT_WRITES_KEY, pid, stored)
+        pipe.incr(PRODUCT_VERSION_KEY)
+        pipe.execute()
+
+    def put(self, product: dict):
+        self._write(product["id"], json.dumps(product))
+
+    def delete(self, pid: int):
+        self._write(pid, DELETED)
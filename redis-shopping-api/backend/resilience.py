@@ -0,0 +1,223 @@
+"""
+Circuit breakers and degraded-mode helpers for the Redis clients.
+
+Each logical DB gets its own breaker. After BREAKER_FAILURES consecutive
+connection/timeout errors the breaker opens and every call fails immediately
+with BreakerOpen. After BREAKER_RESET_SECONDS it half-opens and lets a few
+probe calls through; a successful probe closes it again.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from prometheus_client import Gauge
+
+from redis_clients import get_bytes, pipeline_for
+from redis_metrics import observe_command, observe_pipeline
+
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "5"))
+BREAKER_PROBES = int(os.getenv("BREAKER_PROBES", "1"))
+
+CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+breaker_state = Gauge(
+    "redis_circuit_breaker_state",
+    "Circuit breaker state per logical DB (0=closed, 1=open, 2=half-open)",
+    ["db"],
+    multiprocess_mode="livemax",
+)
+
+
+class BreakerOpen(redis.ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES,
+                 reset_seconds: float = BREAKER_RESET_SECONDS, probes: int = BREAKER_PROBES):
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.probes = probes
+        self.state = CLOSED
+        self._failed = 0
+        self._opened_at = 0.0
+        self._probing = 0
+        self._lock = threading.Lock()
+        breaker_state.labels(name).set(CLOSED)
+
+    def _set(self, state: int):
+        self.state = state
+        breaker_state.labels(self.name).set(state)
+
+    @property
+    def closed(self) -> bool:
+        return self.state == CLOSED
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    return False
+                self._set(HALF_OPEN)
+                self._probing = 0
+            if self._probing >= self.probes:
+                return False
+            self._probing += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failed = 0
+            if self.state != CLOSED:
+                self._set(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failed += 1
+            if self.state == HALF_OPEN or self._failed >= self.failures:
+                self._opened_at = time.monotonic()
+                self._set(OPEN)
+
+    def call(self, fn, *args, **kwargs):
+        if not self.allow():
+            raise BreakerOpen(f"Circuit open for redis db {self.name}")
+        try:
+            result = fn(*args, **kwargs)
+        except (redis.ConnectionError, redis.TimeoutError):
+            self.record_failure()
+            raise
+        except redis.RedisError:
+            # The server answered, so the connection itself is healthy
+            self.record_success()
+            raise
+        self.record_success()
+        return result
+
+
+class _GuardedPipeline:
+    def __init__(self, pipe, breaker: CircuitBreaker):
+        self._pipe = pipe
+        self._breaker = breaker
+
+    def execute(self, *args, **kwargs):
+        size = len(self._pipe.command_stack)
+        start = time.perf_counter()
+        try:
+            return self._breaker.call(self._pipe.execute, *args, **kwargs)
+        finally:
+            observe_pipeline(self._breaker.name, size, time.perf_counter() - start)
+
+    def __len__(self):
+        return len(self._pipe)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._pipe.reset()
+
+    def __getattr__(self, name):
+        attr = getattr(self._pipe, name)
+        if not callable(attr):
+            return attr
+
+        # Queued commands return the pipeline; keep handing out the wrapper
+        def queue(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return self if result is self._pipe else result
+
+        return queue
+
+
+class _GuardedScript:
+    def __init__(self, owner, source: str):
+        self._owner = owner
+        self._source = source
+        self._breaker = owner.breaker
+        self._client = None
+        self._script = None
+
+    def __call__(self, keys=(), args=(), **kwargs):
+        # Bound to the current client on first use, and again if it was swapped
+        client = self._owner.client
+        if client is not self._client:
+            self._script, self._client = client.register_script(self._source), client
+        start = time.perf_counter()
+        try:
+            return self._breaker.call(self._script, keys=keys, args=args, **kwargs)
+        finally:
+            observe_command(self._breaker.name, "EVALSHA", time.perf_counter() - start)
+
+
+class GuardedRedis:
+    """Wraps a Redis client so every network call goes through a breaker."""
+
+    def __init__(self, client, breaker: CircuitBreaker):
+        self.client = client
+        self.breaker = breaker
+
+    def pipeline(self, key: str = None, transaction: bool = True):
+        return _GuardedPipeline(pipeline_for(self.client, key, transaction), self.breaker)
+
+    def register_script(self, script: str):
+        return _GuardedScript(self, script)
+
+    def get_bytes(self, key: str):
+        start = time.perf_counter()
+        try:
+            return self.breaker.call(get_bytes, self.client, key)
+        finally:
+            observe_command(self.breaker.name, "GET", time.perf_counter() - start)
+
+    def close(self):
+        self.client.close()
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+        db = self.breaker.name
+        label = name.upper()
+
+        def command(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return self.breaker.call(attr, *args, **kwargs)
+            finally:
+                observe_command(db, label, time.perf_counter() - start)
+
+        return command
+
+
+class LocalRateLimiter:
+    """Fixed-window limiter kept in process memory, used while Redis is down.
+
+    At most max_keys windows are kept. The least recently hit window is
+    dropped first, so a flood of distinct callers costs O(1) per request and
+    bounded memory; a caller evicted that way starts a fresh window.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self._windows = OrderedDict()
+        self._max_keys = max_keys
+
+    def hit(self, key: str, seconds: int):
+        now = time.monotonic()
+        start, hits = self._windows.get(key, (now, 0))
+        if now - start >= seconds:
+            start, hits = now, 0
+        hits += 1
+        self._windows[key] = (start, hits)
+        self._windows.move_to_end(key)
+        if len(self._windows) > self._max_keys:
+            self._windows.popitem(last=False)
+        return hits, max(int(seconds - (now - start)), 1)
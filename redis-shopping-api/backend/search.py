@@ -0,0 +1,359 @@
+"""
+In-memory full-text search over product names.
+
+Every token maps to a postings list: the sorted product IDs containing it,
+stored as a compact uint32 array. Prefixes up to SEARCH_PREFIX_MAX_LEN
+characters get postings of their own, so search-as-you-type on the last query
+word is one lookup. Longer prefixes are answered from the sorted vocabulary.
+Multi-word queries intersect postings smallest-first with galloping search,
+which skips through long lists in O(log gap) steps.
+
+Names are short, so a token appears once per product in practice: postings
+hold IDs only and BM25 takes tf = 1, scoring by IDF and name length.
+
+The index can be saved to a snapshot file and memory-mapped on startup.
+Postings are then read straight from the mapping, with no tokenizing or
+sorting. A list is copied into process memory only when a product write
+touches it. The snapshot records a fingerprint of the products it was built
+from; one that does not match the current repository is rebuilt instead of
+served. Only one process writes it (the gunicorn master, before forking),
+through a temp file and os.replace.
+
+SearchSync keeps each worker's index in step with the shared product
+repository: every SEARCH_REFRESH_SECONDS it compares the repository's write
+version with the one its index was built from and rebuilds on a change, so
+an admin write served by one worker reaches the others.
+"""
+
+import bisect
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import sys
+import threading
+import uuid
+from array import array
+
+import redis
+
+SEARCH_PREFIX_MAX_LEN = int(os.getenv("SEARCH_PREFIX_MAX_LEN", "6"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+SEARCH_REFRESH_SECONDS = float(os.getenv("SEARCH_REFRESH_SECONDS", "5"))
+
+SNAPSHOT_MAGIC = b"SRCHIDX1"
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(text.casefold())
+
+
+def gallop(postings, target: int, lo: int) -> int:
+    """First index >= lo whose value is >= target."""
+    n = len(postings)
+    bound = 1
+    while lo + bound < n and postings[lo + bound] < target:
+        bound <<= 1
+    return bisect.bisect_left(postings, target, lo + (bound >> 1), min(lo + bound + 1, n))
+
+
+def intersect(lists) -> list:
+    lists = sorted(lists, key=len)
+    result = list(lists[0]) if lists else []
+    for postings in lists[1:]:
+        matched = []
+        i = 0
+        for pid in result:
+            i = gallop(postings, pid, i)
+            if i == len(postings):
+                break
+            if postings[i] == pid:
+                matched.append(pid)
+        result = matched
+        if not result:
+            break
+    return result
+
+
+def _insert(postings, pid: int):
+    i = bisect.bisect_left(postings, pid)
+    if i == len(postings) or postings[i] != pid:
+        postings.insert(i, pid)
+
+
+def _discard(postings, pid: int):
+    i = bisect.bisect_left(postings, pid)
+    if i < len(postings) and postings[i] == pid:
+        del postings[i]
+
+
+class SearchIndex:
+    def __init__(self, prefix_max_len: int = SEARCH_PREFIX_MAX_LEN):
+        self.prefix_max_len = prefix_max_len
+        # token/prefix -> postings (array("I"), or a memoryview into a snapshot)
+        self.tokens = {}
+        self.prefixes = {}
+        self.vocabulary = []  # sorted tokens, for long prefixes and autocomplete
+        self.doc_len = {}  # pid -> number of distinct tokens
+        self.total_len = 0
+        self.dirty = False
+        self.fingerprint = None  # Of the products the index was built from
+        self._mmap = None
+
+    @classmethod
+    def build(cls, products):
+        index = cls()
+        # In ID order every postings insert is an append
+        for product in sorted(products, key=lambda p: p["id"]):
+            index._index(product["id"], product["name"])
+        index.vocabulary = sorted(index.tokens)
+        index.fingerprint = fingerprint(products)
+        return index
+
+    def _prefixes_of(self, token: str):
+        return (token[:n] for n in range(1, min(len(token), self.prefix_max_len) + 1))
+
+    def _postings(self, table: dict, key: str):
+        # Copy-on-write: snapshot postings are read-only views
+        postings = table.get(key)
+        if postings is None:
+            postings = table[key] = array("I")
+        elif not isinstance(postings, array):
+            postings = table[key] = array("I", postings)
+        return postings
+
+    def _index(self, pid: int, name: str):
+        terms = set(tokenize(name))
+        for token in terms:
+            _insert(self._postings(self.tokens, token), pid)
+            for prefix in self._prefixes_of(token):
+                _insert(self._postings(self.prefixes, prefix), pid)
+        self.doc_len[pid] = len(terms)
+        self.total_len += len(terms)
+
+    def add(self, pid: int, name: str, previous_name: str = None):
+        if previous_name is not None:
+            self.remove(pid, previous_name)
+        for token in set(tokenize(name)):
+            if token not in self.tokens:
+                bisect.insort(self.vocabulary, token)
+        self._index(pid, name)
+        self.dirty = True
+
+    def remove(self, pid: int, name: str):
+        for token in set(tokenize(name)):
+            if token not in self.tokens:
+                continue
+            postings = self._postings(self.tokens, token)
+            _discard(postings, pid)
+            if not postings:
+                del self.tokens[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+            for prefix in self._prefixes_of(token):
+                if prefix in self.prefixes:
+                    # Another token with this prefix may still list the product
+                    if not self._has_prefix(pid, prefix):
+                        _discard(self._postings(self.prefixes, prefix), pid)
+        self.total_len -= self.doc_len.pop(pid, 0)
+        self.dirty = True
+
+    def _has_prefix(self, pid: int, prefix: str) -> bool:
+        for token in self._vocabulary_range(prefix):
+            postings = self.tokens[token]
+            i = bisect.bisect_left(postings, pid)
+            if i < len(postings) and postings[i] == pid:
+                return True
+        return False
+
+    def _vocabulary_range(self, prefix: str):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + "\U0010ffff", start)
+        return self.vocabulary[start:end]
+
+    def prefix_postings(self, prefix: str):
+        if len(prefix) <= self.prefix_max_len:
+            return self.prefixes.get(prefix, ())
+        # Past the precomputed lengths only a few tokens share the prefix
+        lists = [self.tokens[token] for token in self._vocabulary_range(prefix)]
+        if len(lists) == 1:
+            return lists[0]
+        return sorted(set().union(*lists))
+
+    def search(self, query: str, limit: int = 20, rank: str = None, prefix: bool = True):
+        """Product IDs matching every query word, the last one as a prefix.
+
+        rank="bm25" orders by BM25 score; otherwise results are in ID order.
+        Returns a list of (pid, score) pairs, score None when unranked.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        lists = [self.tokens.get(term, ()) for term in terms[:-1]]
+        last = terms[-1]
+        lists.append(self.prefix_postings(last) if prefix else self.tokens.get(last, ()))
+        matches = intersect(lists)
+
+        if rank != "bm25":
+            return [(pid, None) for pid in matches[:limit]]
+
+        n = len(self.doc_len) or 1
+        avg_len = self.total_len / n or 1
+        idf = sum(math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for p in lists)
+        scored = []
+        for pid in matches:
+            norm = 1 - BM25_B + BM25_B * self.doc_len.get(pid, avg_len) / avg_len
+            scored.append((idf * (BM25_K1 + 1) / (1 + BM25_K1 * norm), pid))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(pid, round(score, 4)) for score, pid in scored[:limit]]
+
+    def complete(self, prefix: str, limit: int = 10) -> list:
+        """Vocabulary completions of the last word, most frequent first."""
+        terms = tokenize(prefix)
+        if not terms:
+            return []
+        best = heapq.nsmallest(
+            limit,
+            self._vocabulary_range(terms[-1]),
+            key=lambda token: (-len(self.tokens[token]), token),
+        )
+        return [{"token": token, "products": len(self.tokens[token])} for token in best]
+
+    def save(self, path: str):
+        # Layout: magic | u64 meta length | meta JSON | uint32 data, all native order
+        data = array("I")
+        tables = {}
+        for name, table in (("tokens", self.tokens), ("prefixes", self.prefixes)):
+            entries = []
+            for key, postings in table.items():
+                entries.append([key, len(data), len(postings)])
+                data.extend(postings)
+            tables[name] = entries
+        docs = sorted(self.doc_len)
+        docs_offset = len(data)
+        data.extend(docs)
+        data.extend(self.doc_len[pid] for pid in docs)
+        meta = json.dumps({
+            "byteorder": sys.byteorder,
+            "prefix_max_len": self.prefix_max_len,
+            "docs": [docs_offset, len(docs)],
+            "total_len": self.total_len,
+            "fingerprint": self.fingerprint,
+            **tables,
+        }).encode()
+        header = SNAPSHOT_MAGIC + len(meta).to_bytes(8, "little") + meta
+        header += b"\0" * (-len(header) % data.itemsize)
+
+        temp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp, "wb") as f:
+            f.write(header)
+            data.tofile(f)
+        # Workers still mapping the old file keep reading it until they reload
+        os.replace(temp, path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        if bytes(view[:8]) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a search snapshot")
+        meta_len = int.from_bytes(view[8:16], "little")
+        meta = json.loads(bytes(view[16:16 + meta_len]))
+        if meta["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {meta['byteorder']}-endian machine")
+        start = 16 + meta_len
+        start += -start % 4
+        data = view[start:].cast("I")
+
+        index = cls(meta["prefix_max_len"])
+        index._mmap = mapped
+        for name in ("tokens", "prefixes"):
+            table = getattr(index, name)
+            for key, offset, count in meta[name]:
+                table[key] = data[offset:offset + count]
+        offset, count = meta["docs"]
+        index.doc_len = dict(zip(data[offset:offset + count], data[offset + count:offset + 2 * count]))
+        index.total_len = meta["total_len"]
+        index.fingerprint = meta.get("fingerprint")
+        index.vocabulary = sorted(index.tokens)
+        return index
+
+
+def fingerprint(products) -> str:
+    """Digest of what the index covers (IDs and names), for snapshot checks."""
+    digest = hashlib.sha256()
+    for pid, name in sorted((p["id"], p["name"]) for p in products):
+        digest.update(f"{pid}\0{name}\n".encode())
+    return digest.hexdigest()
+
+
+def load_or_build(path: str, load_products, save: bool = False) -> SearchIndex:
+    """Map the snapshot at path if it matches the products, otherwise build it.
+
+    Only the process that owns the snapshot passes save=True; workers that
+    find it stale build in memory and leave the file alone.
+    """
+    products = load_products()
+    if path and os.path.exists(path):
+        try:
+            index = SearchIndex.load(path)
+            if index.fingerprint == fingerprint(products):
+                return index
+        except (OSError, ValueError, KeyError):
+            pass  # Unreadable or from another build: rebuild below
+    index = SearchIndex.build(products)
+    if path and save:
+        try:
+            index.save(path)
+        except OSError:
+            pass
+    return index
+
+
+class SearchSync:
+    """A worker's search index, rebuilt when the product repository changes."""
+
+    def __init__(self, repository, path: str = "", interval: float = SEARCH_REFRESH_SECONDS):
+        self.repository = repository
+        self.path = path
+        self.interval = interval
+        self.index = SearchIndex()
+        self.version = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _version(self):
+        try:
+            return self.repository.version()
+        except redis.RedisError:
+            return None
+
+    def load(self):
+        # Read the version first: a write landing meanwhile triggers a refresh
+        version = self._version()
+        self.index = load_or_build(self.path, self.repository.all)
+        self.version = version
+
+    def refresh(self):
+        version = self._version()
+        if version is None or version == self.version:
+            return
+        self.index = SearchIndex.build(self.repository.all())
+        self.version = version
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.refresh()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="search-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,114 @@
+"""
+Simulated backend latency for demos.
+
+Production (APP_MODE=production, the default) runs every path at true speed.
+APP_MODE=demo restores the classic "slow miss" behaviour, and LATENCY_PROFILE
+can point at a JSON file with per-operation distributions:
+
+    {
+      "product_miss":   {"dist": "lognormal", "median": 0.05, "sigma": 0.6},
+      "db_get_product": {"dist": "fixed", "seconds": 0.1},
+      "login_miss":     {"dist": "trace", "path": "login_latencies.txt"}
+    }
+
+A trace file holds one latency in seconds per line (e.g. exported from
+http_request_duration_seconds samples). Unlisted operations take no time.
+"""
+
+import asyncio
+import json
+import math
+import os
+import random
+
+APP_MODE = os.getenv("APP_MODE", "production")
+LATENCY_PROFILE = os.getenv("LATENCY_PROFILE", "")
+
+
+class Fixed:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def sample(self, rng: random.Random) -> float:
+        return self.seconds
+
+
+class LogNormal:
+    def __init__(self, median: float, sigma: float, cap: float = 10.0):
+        self.mu = math.log(median)
+        self.sigma = sigma
+        self.cap = cap
+
+    def sample(self, rng: random.Random) -> float:
+        return min(rng.lognormvariate(self.mu, self.sigma), self.cap)
+
+
+class Trace:
+    def __init__(self, samples):
+        self.samples = [float(s) for s in samples]
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path) as f:
+            return cls(line for line in f if line.strip())
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.choice(self.samples)
+
+
+# The original demo: every miss costs two seconds on top of the "database"
+DEMO_PROFILE = {
+    "product_miss": Fixed(2.0),
+    "homepage_miss": Fixed(2.0),
+    "login_miss": Fixed(2.0),
+    "cart_new": Fixed(2.0),
+    "cart_empty": Fixed(2.0),
+    "db_get_product": Fixed(0.1),
+    "homepage_generate": Fixed(0.2),
+}
+
+
+def parse_distribution(spec: dict, base_dir: str = "."):
+    kind = spec.get("dist", "fixed")
+    if kind == "fixed":
+        return Fixed(float(spec["seconds"]))
+    if kind == "lognormal":
+        return LogNormal(float(spec["median"]), float(spec.get("sigma", 0.5)),
+                         float(spec.get("cap", 10.0)))
+    if kind == "trace":
+        return Trace.load(os.path.join(base_dir, spec["path"]))
+    raise ValueError(f"Unknown latency distribution: {kind}")
+
+
+class LatencyProfile:
+    def __init__(self, distributions: dict, seed: int = None):
+        self.distributions = distributions
+        self.enabled = bool(distributions)
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path) as f:
+            config = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(path))
+        seed = config.pop("seed", None)
+        return cls({op: parse_distribution(spec, base_dir) for op, spec in config.items()}, seed)
+
+    def sample(self, op: str) -> float:
+        dist = self.distributions.get(op)
+        return dist.sample(self._rng) if dist else 0.0
+
+    async def delay(self, op: str):
+        if not self.enabled:
+            return
+        seconds = self.sample(op)
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+
+def load_profile() -> LatencyProfile:
+    if LATENCY_PROFILE:
+        return LatencyProfile.load(LATENCY_PROFILE)
+    if APP_MODE == "demo":
+        return LatencyProfile(dict(DEMO_PROFILE))
+    return LatencyProfile({})
@@ -0,0 +1,173 @@
+"""
+Opt-in OpenTelemetry tracing (OTEL_TRACING=1).
+
+Spans cover the request, rate limiting, auth, cache lookups, the repository
+and response serialization. Sampling happens at the tail: every span of a
+trace is buffered until the request finishes, then the trace is exported only
+if it was slow (>= OTEL_TRACING_SLOW_MS), failed, or falls in the small
+OTEL_TRACING_SAMPLE_RATIO of ordinary traces. The request span is named
+after the matched route template ("GET /product/{pid}"), with the raw path
+kept in http.target.
+
+OTEL_TRACING_EXPORTER is "console" (default) or "file:<path>" for JSON lines.
+With tracing off, or without the opentelemetry packages, span() is a no-op.
+"""
+
+import contextlib
+import os
+import random
+import threading
+from collections import OrderedDict
+
+from fastapi.responses import JSONResponse
+
+TRACING_ENABLED = os.getenv("OTEL_TRACING", "0") == "1"
+TRACING_EXPORTER = os.getenv("OTEL_TRACING_EXPORTER", "console")
+TRACING_SLOW_MS = float(os.getenv("OTEL_TRACING_SLOW_MS", "250"))
+TRACING_SAMPLE_RATIO = float(os.getenv("OTEL_TRACING_SAMPLE_RATIO", "0.01"))
+TRACING_MAX_PENDING = int(os.getenv("OTEL_TRACING_MAX_PENDING", "2048"))
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+    from opentelemetry.sdk.trace.export import (
+        BatchSpanProcessor,
+        ConsoleSpanExporter,
+        SpanExporter,
+        SpanExportResult,
+    )
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:
+    trace = None
+    SpanProcessor = SpanExporter = object
+
+_noop = contextlib.nullcontext()
+
+
+class JsonLinesExporter(SpanExporter):
+    def __init__(self, path: str):
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        with self._lock:
+            for span in spans:
+                self._file.write(span.to_json(indent=None) + "\n")
+            self._file.flush()
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        self._file.close()
+
+
+class TailSamplingProcessor(SpanProcessor):
+    """Buffers spans per trace and decides when the local root span ends."""
+
+    def __init__(self, next_processor, slow_ms: float, ratio: float, max_pending: int):
+        self._next = next_processor
+        self._slow_ns = slow_ms * 1e6
+        self._ratio = ratio
+        self._max_pending = max_pending
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context=None):
+        pass
+
+    def on_end(self, span):
+        trace_id = span.context.trace_id
+        with self._lock:
+            spans = self._pending.setdefault(trace_id, [])
+            spans.append(span)
+            if span.parent is not None and not span.parent.is_remote:
+                # Not the root yet; cap memory held by traces that never finish
+                while len(self._pending) > self._max_pending:
+                    self._pending.popitem(last=False)
+                return
+            self._pending.pop(trace_id, None)
+
+        slow = span.end_time - span.start_time >= self._slow_ns
+        failed = any(s.status.status_code == StatusCode.ERROR for s in spans)
+        if slow or failed or random.random() < self._ratio:
+            for s in spans:
+                self._next.on_end(s)
+
+    def shutdown(self):
+        self._next.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000):
+        return self._next.force_flush(timeout_millis)
+
+
+def _make_tracer():
+    if not TRACING_ENABLED or trace is None:
+        return None
+    if TRACING_EXPORTER.startswith("file:"):
+        exporter = JsonLinesExporter(TRACING_EXPORTER[len("file:"):])
+    else:
+        exporter = ConsoleSpanExporter()
+    provider = TracerProvider(resource=Resource.create({"service.name": "redis-shopping-api"}))
+    provider.add_span_processor(TailSamplingProcessor(
+        BatchSpanProcessor(exporter), TRACING_SLOW_MS, TRACING_SAMPLE_RATIO, TRACING_MAX_PENDING,
+    ))
+    trace.set_tracer_provider(provider)
+    return provider.get_tracer("redis-shopping-api")
+
+
+tracer = _make_tracer()
+
+
+def span(name: str, **attributes):
+    if tracer is None:
+        return _noop
+    return tracer.start_as_current_span(name, attributes=attributes)
+
+
+def shutdown_tracing():
+    if tracer is not None:
+        trace.get_tracer_provider().shutdown()
+
+
+class TracedJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with span("serialize"):
+            return super().render(content)
+
+
+# Only pay for the extra span when tracing is on
+response_class = TracedJSONResponse if tracer is not None else JSONResponse
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span for each HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if tracer is None or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # Named from the method only until routing matched a template; the raw
+        # path would give every product ID its own span name
+        with tracer.start_as_current_span(
+            scope["method"],
+            kind=SpanKind.SERVER,
+            attributes={"http.method": scope["method"], "http.target": scope["path"]},
+        ) as root:
+
+            async def traced_send(message):
+                if message["type"] == "http.response.start":
+                    root.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        root.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, traced_send)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    root.update_name(f"{scope['method']} {route.path}")
+                    root.set_attribute("http.route", route.path)
@@ -0,0 +1,97 @@
+"""
+Event-loop lag watchdog.
+
+A coroutine sleeps for LOOP_LAG_INTERVAL and measures how late it wakes up;
+that lateness is the event-loop lag. A separate thread watches the
+coroutine's heartbeat: when the loop has not ticked for longer than
+LOOP_BLOCK_THRESHOLD it grabs the loop thread's current stack, which points
+straight at the synchronous call (time.sleep, a blocking Redis/DB call, heavy
+CPU work) holding the loop.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from prometheus_client import Counter, Gauge, Histogram
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.1"))
+
+logger = logging.getLogger("watchdog")
+
+event_loop_lag = Gauge(
+    "event_loop_lag_seconds",
+    "Most recent event-loop lag",
+    multiprocess_mode="livemax",
+)
+event_loop_lag_histogram = Histogram(
+    "event_loop_lag_distribution_seconds",
+    "Event-loop lag per tick",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+event_loop_blocked = Counter(
+    "event_loop_blocked",
+    "Times the event loop was blocked longer than the threshold",
+)
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_BLOCK_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.recent_blocks = deque(maxlen=20)
+        self._heartbeat = time.monotonic()
+        self._loop_thread = None
+        self._task = None
+        self._stop = threading.Event()
+        self._monitor = None
+
+    def start(self):
+        # Must be called from the event loop thread
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._monitor = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._monitor.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0.0)
+            event_loop_lag.set(lag)
+            event_loop_lag_histogram.observe(lag)
+            self._heartbeat = time.monotonic()
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._heartbeat
+            blocked_for = time.monotonic() - beat - self.interval
+            if blocked_for < self.threshold or reported == beat:
+                continue
+            # One report per blocking episode
+            reported = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            event_loop_blocked.inc()
+            self.recent_blocks.append({
+                "at": time.time(),
+                "blocked_for_seconds": round(blocked_for, 3),
+                "stack": stack,
+            })
+            logger.warning("Event loop blocked for %.3fs at:\n%s", blocked_for, stack)
@@ -0,0 +1,14 @@
+"""Gunicorn worker class: uvicorn on uvloop with the httptools parser."""
+
+from uvicorn_worker import UvicornWorker
+
+
+class FastUvicornWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": "uvloop",
+        "http": "httptools",
+        "lifespan": "on",
+        "proxy_headers": True,
+        # Let in-flight requests finish when a worker is asked to stop
+        "timeout_graceful_shutdown": 25,
+    }
@@ -0,0 +1,8 @@
+"""
+Scenario-driven load tests for the Redis Shopping API.
+
+    python -m bench run --scenario browse --duration 10 --out before.json
+    python -m bench compare before.json after.json
+
+Run from the redis-shopping-api directory. See README.md for details.
+"""
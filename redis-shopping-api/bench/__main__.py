@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench.scenarios import SCENARIOS
+
+
+def parse_env(items):
+    env = {}
+    for item in items or []:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def cmd_run(args):
+    from bench.runner import run
+
+    result = asyncio.run(run(
+        args.scenario,
+        duration=args.duration,
+        concurrency=args.concurrency,
+        mode=args.mode,
+        redis_mode=args.redis,
+        seed=args.seed,
+        clients=args.clients,
+        warmup=args.warmup,
+        env=parse_env(args.env),
+    ))
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+def change(old: float, new: float) -> float:
+    return (new - old) / old if old else 0.0
+
+
+def cmd_compare(args):
+    with open(args.baseline) as f:
+        base = json.load(f)
+    with open(args.candidate) as f:
+        cand = json.load(f)
+
+    rows = [("overall", base, cand)]
+    rows += [
+        (name, base["endpoints"][name], cand["endpoints"][name])
+        for name in sorted(set(base["endpoints"]) & set(cand["endpoints"]))
+    ]
+
+    regressions = []
+    print(f"{'endpoint':<18}{'rps':>12}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, b, c in rows:
+        rps = change(b["throughput_rps"], c["throughput_rps"])
+        p = {q: change(b[f"{q}_ms"], c[f"{q}_ms"]) for q in ("p50", "p95", "p99")}
+        print(f"{name:<18}{rps:>+12.1%}{p['p50']:>+10.1%}{p['p95']:>+10.1%}{p['p99']:>+10.1%}")
+        if rps < -args.threshold or p["p99"] > args.threshold:
+            regressions.append(name)
+
+    cmds = change(base["redis_commands_per_request"], cand["redis_commands_per_request"])
+    print(f"redis commands/request: {base['redis_commands_per_request']} -> "
+          f"{cand['redis_commands_per_request']} ({cmds:+.1%})")
+    if cmds > args.threshold:
+        regressions.append("redis_commands_per_request")
+
+    if regressions:
+        print("REGRESSION: " + ", ".join(regressions))
+        sys.exit(1)
+
+
+def cmd_ab(args):
+    # Each side runs in its own process: most settings are read at import time
+    with tempfile.TemporaryDirectory() as tmp:
+        reports = []
+        for side, env in (("a", args.a_env), ("b", args.b_env)):
+            out = os.path.join(tmp, f"{side}.json")
+            command = [sys.executable, "-m", "bench", "run", "--scenario", args.scenario,
+                       "--duration", str(args.duration), "--concurrency", str(args.concurrency),
+                       "--mode", args.mode, "--out", out]
+            for item in env or []:
+                command += ["--env", item]
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            reports.append(out)
+        args.baseline, args.candidate = reports
+        print(f"A: {args.a_env or []}  B: {args.b_env or []}")
+        cmd_compare(args)
+
+
+def cmd_consumer(args):
+    from bench.consumer import run_consumer_bench
+
+    result = run_consumer_bench(args.events, args.batch, redis_mode=args.redis)
+    print(json.dumps(result, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bench", description="Redis Shopping API load tests")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run one scenario and print a JSON report")
+    run.add_argument("--scenario", choices=sorted(SCENARIOS), default="browse")
+    run.add_argument("--duration", type=float, default=10.0)
+    run.add_argument("--warmup", type=float, default=2.0)
+    run.add_argument("--concurrency", type=int, default=32)
+    run.add_argument("--clients", type=int, default=100000,
+                     help="size of the client IP pool requests are spread over")
+    run.add_argument("--mode", choices=["asgi", "http"], default="asgi",
+                     help="asgi calls the app in-process, http goes through uvicorn")
+    run.add_argument("--redis", choices=["fake", "real"], default="fake",
+                     help="fake uses fakeredis, real uses REDIS_* settings")
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--env", action="append", metavar="KEY=VALUE",
+                     help="environment for the app, set before it is imported")
+    run.add_argument("--out", help="also write the report to this file")
+    run.set_defaults(func=cmd_run)
+
+    compare = sub.add_parser("compare", help="compare two reports, exit 1 on regression")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.add_argument("--threshold", type=float, default=0.10,
+                         help="allowed relative throughput drop / p99 growth")
+    compare.set_defaults(func=cmd_compare)
+
+    ab = sub.add_parser("ab", help="run one scenario under two app configurations and compare")
+    ab.add_argument("--scenario", choices=sorted(SCENARIOS), default="hello")
+    ab.add_argument("--duration", type=float, default=10.0)
+    ab.add_argument("--concurrency", type=int, default=32)
+    ab.add_argument("--mode", choices=["asgi", "http"], default="asgi")
+    ab.add_argument("--a-env", action="append", metavar="KEY=VALUE")
+    ab.add_argument("--b-env", action="append", metavar="KEY=VALUE")
+    ab.add_argument("--threshold", type=float, default=0.10)
+    ab.set_defaults(func=cmd_ab)
+
+    consumer = sub.add_parser("consumer", help="event bus publish / consume throughput")
+    consumer.add_argument("--events", type=int, default=100000)
+    consumer.add_argument("--batch", type=int, default=500)
+    consumer.add_argument("--redis", choices=["fake", "real"], default="fake")
+    consumer.set_defaults(func=cmd_consumer)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
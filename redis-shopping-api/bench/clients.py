@@ -0,0 +1,178 @@
+"""
+Two ways of driving the app:
+
+  ASGIClient  calls the ASGI app directly in this process (no sockets)
+  HTTPClient  talks HTTP/1.1 keep-alive to a uvicorn server started in a thread
+"""
+
+import asyncio
+import socket
+import threading
+
+import uvicorn
+
+
+class ASGIClient:
+    def __init__(self, app):
+        self.app = app
+        self._lifespan = None
+        self._lifespan_queue = None
+
+    async def start(self):
+        self._lifespan_queue = asyncio.Queue()
+        started = asyncio.get_running_loop().create_future()
+
+        async def receive():
+            return await self._lifespan_queue.get()
+
+        async def send(message):
+            if message["type"].startswith("lifespan.startup") and not started.done():
+                started.set_result(message["type"])
+
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._lifespan = asyncio.create_task(self.app(scope, receive, send))
+        await self._lifespan_queue.put({"type": "lifespan.startup"})
+        result = await started
+        if result != "lifespan.startup.complete":
+            raise RuntimeError("Application startup failed")
+
+    async def stop(self):
+        await self._lifespan_queue.put({"type": "lifespan.shutdown"})
+        await self._lifespan
+
+    def connect(self):
+        return _ASGIConnection(self.app)
+
+
+class _ASGIConnection:
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method: str, path: str, headers: dict, client_ip: str):
+        path, _, query = path.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+            "client": (client_ip, 50000),
+            "server": ("bench", 80),
+            "state": {},
+        }
+        status = 0
+        body = []
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return status, b"".join(body)
+
+    async def close(self):
+        pass
+
+
+class HTTPClient:
+    def __init__(self, app):
+        self.app = app
+        self.port = _free_port()
+        self._server = None
+        self._thread = None
+
+    async def start(self):
+        config = uvicorn.Config(
+            self.app,
+            host="127.0.0.1",
+            port=self.port,
+            log_level="warning",
+            proxy_headers=True,
+            forwarded_allow_ips="*",
+        )
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            await asyncio.sleep(0.05)
+
+    async def stop(self):
+        self._server.should_exit = True
+        await asyncio.to_thread(self._thread.join)
+
+    def connect(self):
+        return _HTTPConnection(self.port)
+
+
+class _HTTPConnection:
+    def __init__(self, port: int):
+        self.port = port
+        self._reader = None
+        self._writer = None
+
+    async def request(self, method: str, path: str, headers: dict, client_ip: str):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection("127.0.0.1", self.port)
+        # X-Forwarded-For lets one socket stand in for many client IPs
+        lines = [f"{method} {path} HTTP/1.1", "host: bench", f"x-forwarded-for: {client_ip}",
+                 "content-length: 0"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        self._writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        status = int(status_line.split()[1])
+        length, chunked, close = 0, False, False
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode().partition(":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding" and "chunked" in value:
+                chunked = True
+            elif name == "connection" and value == "close":
+                close = True
+
+        body = b""
+        if chunked:
+            while True:
+                size = int((await self._reader.readline()).strip(), 16)
+                body += (await self._reader.readexactly(size + 2))[:size]
+                if size == 0:
+                    break
+        elif length:
+            body = await self._reader.readexactly(length)
+        if close:
+            await self.close()
+        return status, body
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
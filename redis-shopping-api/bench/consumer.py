@@ -0,0 +1,65 @@
+"""
+Event pipeline throughput: publish N events through EventBus, then drain them
+with one EventConsumer running the real handlers (popularity, analytics).
+The stream is a throwaway, but the handlers write popularity and analytics
+keys, so --redis real should point at a scratch instance.
+"""
+
+import os
+import sys
+import time
+import uuid
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+
+def connect(redis_mode: str):
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    from resilience import CircuitBreaker, GuardedRedis
+
+    if redis_mode == "fake":
+        import fakeredis
+
+        client = fakeredis.FakeRedis(decode_responses=True)
+    else:
+        from redis_clients import make_client
+
+        client = make_client(0)
+    return GuardedRedis(client, CircuitBreaker("0"))
+
+
+def run_consumer_bench(events: int, batch: int, redis_mode: str = "fake", products: int = 1000) -> dict:
+    client = connect(redis_mode)
+    from consumer import build_consumer
+    from events import EventBus
+
+    stream = f"bench-events:{{bus}}:{uuid.uuid4().hex[:8]}"
+    bus = EventBus(client, stream=stream, max_len=events + 1, buffer_max=events)
+    consumer = build_consumer(client, stream=stream, batch=batch, name="bench")
+    consumer.ensure_group()
+
+    try:
+        start = time.perf_counter()
+        for i in range(events):
+            bus.publish("cart" if i % 10 == 0 else "view", pid=i % products + 1)
+        while bus._buffer:
+            bus.flush()
+        published = time.perf_counter() - start
+
+        start = time.perf_counter()
+        while consumer.processed < events:
+            if not consumer.poll():
+                break
+        consumed = time.perf_counter() - start
+    finally:
+        client.delete(stream)
+
+    return {
+        "redis": redis_mode,
+        "events": events,
+        "batch": batch,
+        "consumed": consumer.processed,
+        "publish_events_per_s": round(events / published, 1),
+        "consume_events_per_s": round(consumer.processed / consumed, 1) if consumed else 0.0,
+    }
@@ -0,0 +1,44 @@
+"""
+Counts Redis commands issued by the app, whatever client wrapper sits on top.
+Pipelined commands count individually; a pipeline round trip also counts once
+in `round_trips`.
+"""
+
+import redis
+from redis.client import Pipeline
+
+
+class RedisStats:
+    def __init__(self):
+        self.commands = 0
+        self.round_trips = 0
+        self._patched = []
+
+    def install(self):
+        stats = self
+        execute_command = redis.Redis.execute_command
+        execute = Pipeline.execute
+
+        def counted_command(client, *args, **kwargs):
+            stats.commands += 1
+            stats.round_trips += 1
+            return execute_command(client, *args, **kwargs)
+
+        def counted_execute(pipe, *args, **kwargs):
+            stats.commands += len(pipe.command_stack)
+            stats.round_trips += 1
+            return execute(pipe, *args, **kwargs)
+
+        redis.Redis.execute_command = counted_command
+        Pipeline.execute = counted_execute
+        self._patched = [(redis.Redis, "execute_command", execute_command),
+                         (Pipeline, "execute", execute)]
+
+    def uninstall(self):
+        for owner, name, original in self._patched:
+            setattr(owner, name, original)
+        self._patched = []
+
+    def reset(self):
+        self.commands = 0
+        self.round_trips = 0
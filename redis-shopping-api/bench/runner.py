@@ -0,0 +1,166 @@
+"""
+Closed-loop load generator: N virtual users each send requests back to back
+for a fixed duration. Every virtual user has its own seeded RNG, so two runs
+with the same arguments send the same request sequence. Requests are spread
+over a pool of client IPs so the per-IP rate limit models many real clients
+rather than throttling the generator itself.
+"""
+
+import asyncio
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from collections import defaultdict
+
+from bench.clients import ASGIClient, HTTPClient
+from bench.redis_stats import RedisStats
+from bench.scenarios import SCENARIOS, login, pick
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+
+def load_app(redis_mode: str, env: dict):
+    os.environ.update(env)
+    metrics_dir = env.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        # Same as the gunicorn profile: a fresh directory before prometheus_client loads
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    main = importlib.import_module("main")
+    if redis_mode == "fake":
+        use_fakeredis(main)
+    return main
+
+
+def use_fakeredis(main):
+    import fakeredis
+
+    from resilience import GuardedRedis
+
+    # Swap the client behind every breaker-wrapped connection for an in-memory
+    # server; one FakeServer keeps the logical DBs side by side like real Redis
+    server = fakeredis.FakeServer()
+    for value in vars(main).values():
+        if isinstance(value, GuardedRedis):
+            value.client = fakeredis.FakeRedis(
+                server=server, db=int(value.breaker.name), decode_responses=True
+            )
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    i = min(int(round(q * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[i]
+
+
+def summarize(latencies, statuses, elapsed: float) -> dict:
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "statuses": dict(sorted(statuses.items())),
+    }
+
+
+def client_ip(rng: random.Random, clients: int) -> str:
+    n = rng.randrange(clients)
+    return f"10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}"
+
+
+async def virtual_user(vu: int, client, scenario: dict, seed: int, clients: int,
+                       deadline: float, record):
+    rng = random.Random(seed * 100003 + vu)
+    conn = client.connect()
+    user = {}
+    try:
+        if scenario["login"]:
+            method, path, headers = login(rng, user)
+            status, body = await conn.request(method, path, headers, client_ip(rng, clients))
+            if status == 200:
+                user["token"] = json.loads(body)["token"]
+        while time.perf_counter() < deadline:
+            step = pick(scenario, rng)
+            method, path, headers = step(rng, user)
+            start = time.perf_counter()
+            status, _ = await conn.request(method, path, headers, client_ip(rng, clients))
+            record(step.__name__, time.perf_counter() - start, status)
+    finally:
+        await conn.close()
+
+
+async def run(scenario_name: str, duration: float, concurrency: int, mode: str,
+              redis_mode: str, seed: int, clients: int, warmup: float, env: dict) -> dict:
+    scenario = SCENARIOS[scenario_name]
+    main = load_app(redis_mode, {**scenario.get("env", {}), **env})
+    client = ASGIClient(main.app) if mode == "asgi" else HTTPClient(main.app)
+    stats = RedisStats()
+
+    await client.start()
+    stats.install()
+    try:
+        setup = client.connect()
+        for method, path, headers in scenario.get("setup", ()):
+            status, body = await setup.request(method, path, headers, "127.0.0.1")
+            if status >= 400:
+                raise RuntimeError(f"Setup {method} {path} failed: {status} {body!r}")
+        await setup.close()
+
+        if warmup:
+            # Fill caches so a run measures steady state, then forget the numbers
+            await asyncio.gather(*(
+                virtual_user(vu, client, scenario, seed + 1, clients,
+                             time.perf_counter() + warmup, lambda *a: None)
+                for vu in range(concurrency)
+            ))
+        stats.reset()
+
+        latencies = []
+        per_step = defaultdict(list)
+        statuses = defaultdict(int)
+        step_statuses = defaultdict(lambda: defaultdict(int))
+
+        def record(step: str, latency: float, status: int):
+            latencies.append(latency)
+            per_step[step].append(latency)
+            statuses[str(status)] += 1
+            step_statuses[step][str(status)] += 1
+
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(
+            virtual_user(vu, client, scenario, seed, clients, deadline, record)
+            for vu in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+    finally:
+        stats.uninstall()
+        await client.stop()
+
+    result = {
+        "scenario": scenario_name,
+        "mode": mode,
+        "redis": redis_mode,
+        "duration_s": round(elapsed, 3),
+        "concurrency": concurrency,
+        "seed": seed,
+        "clients": clients,
+        "env": env,
+        **summarize(latencies, statuses, elapsed),
+        "redis_commands_per_request": round(stats.commands / max(len(latencies), 1), 3),
+        "redis_round_trips_per_request": round(stats.round_trips / max(len(latencies), 1), 3),
+        "endpoints": {
+            step: summarize(values, step_statuses[step], elapsed)
+            for step, values in sorted(per_step.items())
+        },
+    }
+    return result
@@ -0,0 +1,118 @@
+"""
+Request mixes. Each scenario is a list of (weight, step) pairs; a step is a
+function taking (rng, user) and returning (method, path, headers). `user` is
+the per-virtual-user state dict and may be used to carry a login token.
+
+A scenario may also set app environment ("env") and list requests to send
+once before the run ("setup"), e.g. to stock products through the admin API.
+"""
+
+import random
+
+PRODUCT_IDS = [1, 2]
+MISSING_PRODUCT_IDS = list(range(1000, 1100))
+EMAIL = "user@example.com"
+PASSWORD = "password123"
+
+
+# Every virtual user logs in as the same account; lift its quota so the
+# scenario measures the app, not the per-user limit
+SHARED_USER_QUOTA = {
+    "QUOTA_PLANS": '{"user": {"second": 1000000, "minute": 1000000, "day": 1000000}}',
+}
+
+
+def zipf_choice(rng: random.Random, items, s: float = 1.2):
+    weights = [1 / (i + 1) ** s for i in range(len(items))]
+    return rng.choices(items, weights)[0]
+
+
+def auth(user):
+    return {"authorization": f"Bearer {user['token']}"} if user.get("token") else {}
+
+
+def product(rng, user):
+    return "GET", f"/product/{zipf_choice(rng, PRODUCT_IDS)}", {}
+
+
+def missing_product(rng, user):
+    return "GET", f"/product/{rng.choice(MISSING_PRODUCT_IDS)}", {}
+
+
+def hot_product(rng, user):
+    return "GET", f"/product/{PRODUCT_IDS[0]}", {}
+
+
+def homepage(rng, user):
+    return "GET", "/homepage", {}
+
+
+def login(rng, user):
+    return "POST", f"/login?email={EMAIL}&password={PASSWORD}", {}
+
+
+def bad_login(rng, user):
+    return "POST", f"/login?email=bot{rng.randrange(10 ** 6)}@example.com&password=x", {}
+
+
+def cart_add(rng, user):
+    return "POST", f"/cart/add?pid={rng.choice(PRODUCT_IDS)}&qty=1", auth(user)
+
+
+def cart_get(rng, user):
+    return "GET", "/cart", auth(user)
+
+
+def checkout(rng, user):
+    # Some clients lost the response and retry with the same key
+    if user.get("idempotency") and rng.random() < 0.1:
+        key = user["idempotency"]
+    else:
+        key = user["idempotency"] = f"{rng.getrandbits(64):016x}"
+    return "POST", "/checkout", {**auth(user), "idempotency-key": key}
+
+
+def hello(rng, user):
+    return "GET", "/", {}
+
+
+SCENARIOS = {
+    "browse": {
+        "login": False,
+        "steps": [(70, product), (25, homepage), (5, missing_product)],
+    },
+    "cart": {
+        "login": True,
+        "env": SHARED_USER_QUOTA,
+        "steps": [(50, cart_add), (40, cart_get), (10, product)],
+    },
+    "login-storm": {
+        "login": False,
+        "steps": [(80, login), (20, bad_login)],
+    },
+    "hot-key": {
+        "login": False,
+        "steps": [(95, hot_product), (5, homepage)],
+    },
+    "checkout": {
+        # Every virtual user buys the same two SKUs: one deep, one that sells out
+        "login": True,
+        "env": {"ADMIN_TOKEN": "bench", **SHARED_USER_QUOTA},
+        "setup": [
+            ("PUT", "/admin/products/1?name=iPhone%2015&price=80000&stock=10000000&category=phones",
+             {"x-admin-token": "bench"}),
+            ("PUT", "/admin/products/2?name=MacBook%20Pro&price=180000&stock=500&category=laptops",
+             {"x-admin-token": "bench"}),
+        ],
+        "steps": [(50, cart_add), (50, checkout)],
+    },
+    "hello": {
+        "login": False,
+        "steps": [(100, hello)],
+    },
+}
+
+
+def pick(scenario: dict, rng: random.Random):
+    steps = scenario["steps"]
+    return rng.choices([s for _, s in steps], [w for w, _ in steps])[0]
@@ -0,0 +1,84 @@
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+import redis  # noqa: E402
+
+REDIS_SERVER = os.getenv("REDIS_SERVER_BIN", "redis-server")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port: int, timeout: float = 5.0):
+    client = redis.Redis(port=port)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            client.ping()
+            return
+        except redis.ConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+        finally:
+            client.close()
+
+
+@pytest.fixture(scope="session")
+def redis_servers():
+    """Three throwaway redis-server processes: [(host, port), ...]."""
+    if shutil.which(REDIS_SERVER) is None:
+        pytest.skip(f"{REDIS_SERVER} not installed")
+    nodes, processes = [], []
+    try:
+        for _ in range(3):
+            port = free_port()
+            processes.append(subprocess.Popen(
+                [REDIS_SERVER, "--port", str(port), "--bind", "127.0.0.1",
+                 "--save", "", "--appendonly", "no", "--databases", "4"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            ))
+            wait_for(port)
+            nodes.append(("127.0.0.1", port))
+        yield nodes
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+
+@pytest.fixture(params=["fakeredis", "redis-server"])
+def sharded(request):
+    """ShardedRedis over three nodes: in-memory fakes, then real servers if installed."""
+    from redis_clients import ShardedRedis
+
+    if request.param == "fakeredis":
+        import fakeredis
+
+        client = ShardedRedis([("shard-a", 6379), ("shard-b", 6379), ("shard-c", 6379)], db=3)
+        # Same ring, one independent in-memory server per node
+        client.clients = {
+            name: fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+            for name in client.clients
+        }
+    else:
+        client = ShardedRedis(request.getfixturevalue("redis_servers"), db=3)
+        for node in client.clients.values():
+            node.flushdb()
+    yield client
+    client.close()
@@ -0,0 +1,35 @@
+"""
+Cluster mode (REDIS_MODE=cluster) wiring, with the cluster client mocked:
+there is no in-memory cluster to run against.
+"""
+
+from unittest import mock
+
+import fakeredis
+import redis
+
+import redis_clients
+import replicas
+from resilience import OPEN, CircuitBreaker, GuardedRedis
+
+
+def test_cluster_shares_one_client_for_every_db(monkeypatch):
+    monkeypatch.setattr(redis_clients, "REDIS_MODE", "cluster")
+    monkeypatch.setattr(redis_clients, "_cluster", None)
+    with mock.patch.object(redis_clients, "RedisCluster") as cluster:
+        clients = {redis_clients.make_client(db) for db in range(4)}
+    assert len(clients) == 1
+    cluster.assert_called_once()
+
+
+def test_cluster_replica_reads_fall_back_to_the_primary():
+    primary = GuardedRedis(fakeredis.FakeRedis(decode_responses=True), CircuitBreaker("cluster-test"))
+    primary.set("product:{1}", "cached")
+    with mock.patch.object(replicas, "RedisCluster") as cluster:
+        cluster.return_value.get.side_effect = redis.ConnectionError("replica down")
+        reader = replicas.ClusterReader(primary, 0)
+        for _ in range(10):
+            assert reader.read("product:{1}") == ("cached", False)
+    # Failing replica reads open their own breaker; the primary's stays closed
+    assert reader._client.breaker.state == OPEN
+    assert primary.breaker.closed
@@ -0,0 +1,124 @@
+"""
+Client-side sharding (REDIS_MODE=sharded): ring routing, and every routed
+command against in-memory fakeredis nodes and, when redis-server is
+installed, real server processes.
+"""
+
+from collections import Counter
+
+import pytest
+import redis
+
+from keys import cart_key, hash_tag, idempotency_key, order_key, orders_key, reservation_key
+from redis_clients import HashRing, ShardedRedis
+
+NODES = ["a:6379", "b:6379", "c:6379"]
+
+
+def keys_on_different_shards(client: ShardedRedis):
+    first = cart_key(0)
+    for uid in range(1, 1000):
+        if client._ring.node_for(cart_key(uid)) != client._ring.node_for(first):
+            return first, cart_key(uid)
+    raise AssertionError("every key landed on one shard")
+
+
+def test_ring_spreads_keys_over_every_node():
+    ring = HashRing(NODES)
+    counts = Counter(ring.node_for(cart_key(uid)) for uid in range(3000))
+    assert set(counts) == set(NODES)
+    assert min(counts.values()) > 3000 / len(NODES) * 0.6
+
+
+def test_ring_is_deterministic_and_consistent():
+    ring = HashRing(NODES)
+    assert HashRing(NODES).node_for("cart:{7}") == ring.node_for("cart:{7}")
+
+    # Dropping a node only moves the keys that node owned
+    smaller = HashRing(NODES[:2])
+    for uid in range(2000):
+        key = cart_key(uid)
+        if ring.node_for(key) != NODES[2]:
+            assert smaller.node_for(key) == ring.node_for(key)
+
+
+def test_ring_routes_on_hash_tag_only():
+    ring = HashRing(NODES)
+    for uid in range(500):
+        node = ring.node_for(cart_key(uid))
+        assert ring.node_for(reservation_key(uid)) == node
+        assert ring.node_for(order_key(uid, "abc")) == node
+        assert ring.node_for(orders_key(uid)) == node
+        assert ring.node_for(idempotency_key(uid, "retry-1")) == node
+        assert ring.node_for(str(uid)) == node
+    assert hash_tag("cart:{42}") == "42"
+
+
+def test_commands_land_on_the_owning_server(sharded):
+    for uid in range(200):
+        sharded.set(cart_key(uid), f"cart-{uid}")
+        sharded.set(reservation_key(uid), f"reservation-{uid}")
+
+    for name, node in sharded.clients.items():
+        owned = set(node.keys("*"))
+        for key in owned:
+            assert sharded._ring.node_for(key) == name
+    assert sum(node.dbsize() for node in sharded.clients.values()) == 400
+    assert sharded.get(cart_key(17)) == "cart-17"
+
+
+def test_user_keys_are_colocated(sharded):
+    for uid in range(50):
+        sharded.set(cart_key(uid), "[]")
+        sharded.set(reservation_key(uid), "{}")
+        node = sharded.client_for(cart_key(uid))
+        assert node.exists(cart_key(uid), reservation_key(uid)) == 2
+
+
+def test_script_runs_on_the_tagged_shard(sharded):
+    move = sharded.register_script("""
+local cart = redis.call('GET', KEYS[1])
+redis.call('SET', KEYS[2], cart)
+redis.call('DEL', KEYS[1])
+return cart
+""")
+    for uid in range(30):
+        sharded.set(cart_key(uid), f"cart-{uid}")
+        assert move(keys=[cart_key(uid), reservation_key(uid)]) == f"cart-{uid}"
+        node = sharded.client_for(cart_key(uid))
+        assert node.get(reservation_key(uid)) == f"cart-{uid}"
+        assert not node.exists(cart_key(uid))
+
+
+def test_script_across_shards_raises(sharded):
+    first, second = keys_on_different_shards(sharded)
+    script = sharded.register_script("return redis.call('MGET', KEYS[1], KEYS[2])")
+    with pytest.raises(redis.RedisError):
+        script(keys=[first, second])
+    with pytest.raises(redis.RedisError):
+        script(keys=[])
+
+
+def test_multi_key_commands_across_shards_raise(sharded):
+    first, second = keys_on_different_shards(sharded)
+    sharded.set(first, "1")
+    sharded.set(second, "2")
+    with pytest.raises(redis.RedisError):
+        sharded.mget(first, second)
+    with pytest.raises(redis.RedisError):
+        sharded.delete(first, second)
+    with pytest.raises(redis.RedisError):
+        sharded.zunionstore(first + ":out", [first, second])
+
+    # Same tag: one shard, works
+    assert sharded.mget(cart_key(5), reservation_key(5)) == [None, None]
+    assert sharded.delete(first) == 1
+
+
+def test_pipeline_stays_on_one_shard(sharded):
+    pipe = sharded.pipeline(cart_key(9))
+    pipe.set(cart_key(9), "[]")
+    pipe.set(reservation_key(9), "{}")
+    pipe.execute()
+    node = sharded.client_for(cart_key(9))
+    assert node.mget(cart_key(9), reservation_key(9)) == ["[]", "{}"]